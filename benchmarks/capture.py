@@ -0,0 +1,104 @@
+"""
+Compares per-capture latency of the screen capture backends.
+
+Starts a private Xvfb display (unless `--display` is given) so the numbers are
+reproducible on headless hosts:
+
+    python3 benchmarks/capture.py --iterations 50 --resolution 1920x1080
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def start_xvfb(display, resolution):
+    if not shutil.which("Xvfb"):
+        sys.exit("Xvfb is required for this benchmark (e.g. `apt install xvfb`)")
+    process = subprocess.Popen(
+        ["Xvfb", display, "-screen", "0", f"{resolution}x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    # Give the server a moment to accept connections
+    time.sleep(1)
+    return process
+
+
+def legacy_capture(file_path):
+    """
+    The capture path before persistent backends: a new X connection per call,
+    `ImageGrab.grab` and a PNG written to disk.
+    """
+    import Xlib.display
+    from PIL import ImageGrab
+
+    screen = Xlib.display.Display().screen()
+    size = screen.width_in_pixels, screen.height_in_pixels
+    screenshot = ImageGrab.grab(bbox=(0, 0, size[0], size[1]))
+    screenshot.save(file_path)
+
+
+def measure(name, capture, iterations, warmup=3):
+    for _ in range(warmup):
+        capture()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        capture()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{name:<14} mean {statistics.mean(timings):8.2f} ms"
+        f"   p50 {statistics.median(timings):8.2f} ms   p95 {p95:8.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark screen capture backends.")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument(
+        "--display",
+        help="Use an existing X display instead of starting Xvfb",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    xvfb = None
+    if args.display:
+        os.environ["DISPLAY"] = args.display
+    else:
+        os.environ["DISPLAY"] = ":99"
+        xvfb = start_xvfb(":99", args.resolution)
+
+    from operate.utils.screenshot import DefaultCaptureBackend, MssCaptureBackend
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_path = os.path.join(tmp_dir, "screenshot.png")
+            print(f"[capture benchmark] {args.iterations} captures per backend")
+            measure("legacy", lambda: legacy_capture(file_path), args.iterations)
+
+        default_backend = DefaultCaptureBackend()
+        measure("default", default_backend.grab, args.iterations)
+        default_backend.close()
+
+        mss_backend = MssCaptureBackend()
+        measure("mss raw", mss_backend.grab_raw, args.iterations)
+        measure("mss frame", mss_backend.grab, args.iterations)
+        mss_backend.close()
+    finally:
+        if xvfb:
+            xvfb.terminate()
+
+
+if __name__ == "__main__":
+    main()
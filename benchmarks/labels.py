@@ -0,0 +1,99 @@
+"""
+Compares the overlap suppression of `add_labels` with the original pairwise loop.
+
+Generates synthetic detections (scattered UI elements and dense spreadsheet-like
+grids whose cells touch), checks both implementations keep exactly the same
+boxes and reports the time per frame:
+
+    python3 benchmarks/labels.py --sizes 10 100 1000 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def scattered_boxes(count, rng, width=1920, height=1080):
+    boxes = []
+    for _ in range(count):
+        box_width = rng.choice([rng.uniform(8, 60), rng.uniform(60, 400)])
+        box_height = rng.uniform(8, 60)
+        x1 = round(rng.uniform(0, width - box_width))
+        y1 = round(rng.uniform(0, height - box_height))
+        boxes.append((x1, y1, x1 + round(box_width), y1 + round(box_height)))
+    return boxes
+
+
+def grid_boxes(count, rng, cell_width=64, cell_height=20, columns=30):
+    """
+    Spreadsheet-like cells that share their edges, in random detection order.
+    """
+    boxes = [
+        (
+            (index % columns) * cell_width,
+            (index // columns) * cell_height,
+            (index % columns + 1) * cell_width,
+            (index // columns + 1) * cell_height,
+        )
+        for index in range(count)
+    ]
+    rng.shuffle(boxes)
+    return boxes
+
+
+def reference_selection(boxes):
+    """
+    The original greedy loop from `add_labels`.
+    """
+    from operate.utils.label import is_overlapping
+
+    drawn_boxes = []
+    kept = []
+    for index, box in enumerate(boxes):
+        if not any(is_overlapping(box, drawn) for drawn in drawn_boxes):
+            drawn_boxes.append(box)
+            kept.append(index)
+    return kept
+
+
+def measure(function, boxes, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(boxes)
+        timings.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark label overlap suppression.")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 100, 500, 1000, 2500, 5000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    from operate.utils.label import select_non_overlapping_boxes
+
+    rng = random.Random(args.seed)
+    print(f"{'boxes':>6} {'layout':<10} {'kept':>6} {'pairwise':>12} {'grid':>12}")
+    for size in args.sizes:
+        for layout, generate in (("scattered", scattered_boxes), ("grid", grid_boxes)):
+            boxes = generate(size, rng)
+            expected, reference_time = measure(reference_selection, boxes, args.repeat)
+            kept, grid_time = measure(select_non_overlapping_boxes, boxes, args.repeat)
+            if kept != expected:
+                sys.exit(f"Mismatch for {size} {layout} boxes (seed {args.seed})")
+            print(
+                f"{size:>6} {layout:<10} {len(kept):>6}"
+                f" {reference_time:>9.2f} ms {grid_time:>9.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Compares the stock YOLO detector with its CPU-optimized exports.
+
+For every runtime it reports the load time, per-frame latency and how many
+boxes agree with the stock PyTorch model (greedy IoU matching):
+
+    python3 benchmarks/yolo.py --image readme/self-operating-computer.png --iterations 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RUNTIMES = [("torch", False), ("onnx", False), ("onnx", True), ("openvino", False)]
+
+
+def iou(first, second):
+    x1, y1 = max(first[0], second[0]), max(first[1], second[1])
+    x2, y2 = min(first[2], second[2]), min(first[3], second[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (
+        (first[2] - first[0]) * (first[3] - first[1])
+        + (second[2] - second[0]) * (second[3] - second[1])
+        - intersection
+    )
+    return intersection / union if union else 0.0
+
+
+def agreement(reference, boxes, threshold):
+    """
+    Share of boxes matched one-to-one with the reference at `threshold` IoU.
+    """
+    if not reference and not boxes:
+        return 1.0
+    unmatched = list(boxes)
+    matched = 0
+    for box in reference:
+        best = max(unmatched, key=lambda other: iou(box, other), default=None)
+        if best is not None and iou(box, best) >= threshold:
+            unmatched.remove(best)
+            matched += 1
+    return matched / max(len(reference), len(boxes))
+
+
+def detect(model, image):
+    results = model(image, verbose=False)
+    return [box.xyxy[0].tolist() for box in results[0].boxes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark YOLO runtimes.")
+    parser.add_argument(
+        "--image",
+        action="append",
+        help="Screenshot to detect on, can be repeated",
+        default=None,
+    )
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    from PIL import Image
+
+    from operate.utils.label import get_yolo_model
+
+    image_paths = args.image or ["readme/self-operating-computer.png"]
+    images = [Image.open(path).convert("RGB") for path in image_paths]
+
+    reference = None
+    print(f"[yolo benchmark] {len(images)} image(s), {args.iterations} iterations")
+    for runtime, int8 in RUNTIMES:
+        name = runtime + (" int8" if int8 else "")
+        start = time.perf_counter()
+        try:
+            model = get_yolo_model(runtime, int8)
+            detect(model, images[0])
+        except Exception as e:
+            print(f"{name:<14} skipped: {e}")
+            continue
+        load_time = time.perf_counter() - start
+
+        timings = []
+        for _ in range(args.iterations):
+            for image in images:
+                begin = time.perf_counter()
+                detect(model, image)
+                timings.append((time.perf_counter() - begin) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+        boxes = [detect(model, image) for image in images]
+        if reference is None:
+            reference = boxes
+        score = statistics.mean(
+            agreement(expected, found, args.iou)
+            for expected, found in zip(reference, boxes)
+        )
+        print(
+            f"{name:<14} load {load_time:6.2f} s   mean {statistics.mean(timings):8.2f} ms"
+            f"   p95 {p95:8.2f} ms   boxes {sum(map(len, boxes)):5d}"
+            f"   agreement {score:6.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
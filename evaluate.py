@@ -118,10 +118,16 @@ def evaluate_final_screenshot(guideline):
 
 def run_test_case(objective, guideline, model):
     """Returns True if the result of the test with the given prompt meets the given guideline for the given model."""
-    # Run `operate` with the model to evaluate and the test case prompt
+    # Run `operate` with the model to evaluate and the test case prompt.
+    # Screenshots are only kept in memory by default, so ask for the final one on disk.
     subprocess.run(
         ["operate", "-m", model, "--prompt", f'"{objective}"'],
         stdout=subprocess.DEVNULL,
+        env={
+            **os.environ,
+            "OPERATE_ARTIFACT_LEVEL": "final",
+            "OPERATE_ARTIFACT_FORMAT": "png",
+        },
     )
 
     try:
@@ -3,8 +3,8 @@ import sys
 
 import google.generativeai as genai
 from dotenv import load_dotenv
-from ollama import Client
-from openai import OpenAI
+from ollama import AsyncClient
+from openai import AsyncOpenAI
 import anthropic
 from prompt_toolkit.shortcuts import input_dialog
 
@@ -18,9 +18,60 @@ class Config:
         openai_api_key (str): API key for OpenAI.
         google_api_key (str): API key for Google.
         ollama_host (str): url to ollama running remotely.
+        ollama_model (str): Ollama model tag used by `-m ollama`, any vision model such as `llava:13b` or `llama3.2-vision`.
+        ollama_keep_alive (str): How long Ollama keeps the model loaded after a request, e.g. `30m`, or `-1` to keep it loaded.
+        ollama_options (dict): Ollama model options sent with every request, from `OPERATE_OLLAMA_NUM_CTX` and `OPERATE_OLLAMA_NUM_THREAD`.
+        local_base_url (str): Endpoint of a local OpenAI compatible server used by `-m local`, e.g. llama.cpp or vLLM.
+        local_model (str): Model name sent to the local server.
+        artifact_level (str): Images written to disk, one of `none`, `final`, `step` or `debug`. Defaults to `debug` in verbose mode and `none` otherwise.
+        artifact_format (str): Image format of written artifacts, e.g. `png`, `jpeg` or `webp`.
+        artifact_compression (int): PNG compression level (0-9) or JPEG/WebP quality (1-100).
+        capture_backend (str): Screen capture backend, one of `auto`, `mss` or `default`.
+        settle_timeout (float): Maximum number of seconds to wait for the screen to settle.
+        settle_quiet (float): Seconds without screen changes after which the screen counts as settled.
+        ocr_languages (list): Language codes for the EasyOCR reader.
+        ocr_gpu (bool): Flag indicating whether EasyOCR runs on the GPU.
+        ocr_prewarm (bool): Flag indicating whether the EasyOCR reader is loaded in the background at startup.
+        ocr_cache_size (int): Number of frames whose OCR results are kept in memory.
+        ocr_speculative (bool): Flag indicating whether OCR starts as soon as a frame is captured, while the model request runs.
+        ocr_incremental (bool): Flag indicating whether OCR only re-reads the regions that changed since the last frame.
+        ocr_tile_size (int): Tile edge length in pixels used to find changed regions.
+        ocr_tile_margin (int): Pixels added around changed regions before they are read.
+        ocr_incremental_max_dirty (float): Changed fraction of the screen above which the whole frame is read again.
+        metrics_file (str): Optional path the session metrics are written to as JSON.
+        yolo_runtime (str): Runtime of the set-of-mark detector, one of `torch`, `onnx` or `openvino`.
+        yolo_int8 (bool): Flag indicating whether an exported detector is quantized to int8.
+        yolo_cache_dir (str): Directory exported detectors are kept in.
+        yolo_prewarm (bool): Flag indicating whether the detector is loaded in the background at startup.
+        stuck_threshold (int): Consecutive unchanged frames after which the loop counts as stuck, 0 disables the check.
+        stuck_action (str): What to do when stuck, one of `reprompt`, `escalate` or `abort`.
+        stuck_escalation_model (str): Model used for a stuck step when `stuck_action` is `escalate`.
+        http_max_connections (int): Maximum number of connections per provider endpoint.
+        http_max_keepalive (int): Maximum number of idle connections kept open per provider endpoint.
+        http_keepalive_expiry (float): Seconds an idle connection is kept open.
+        http_timeout (float): Seconds to wait for a provider response.
+        history_full_images (int): Number of earlier screenshots kept at full resolution in the message history.
+        history_old_images (str): What happens to older screenshots, one of `thumbnail`, `drop`, `summary` or `keep`.
+        history_thumbnail_width (int): Width in pixels of older screenshots when `history_old_images` is `thumbnail`.
+        response_cache (str): Provider response cache mode, one of `off`, `record` or `replay`.
+        response_cache_dir (str): Directory the recorded responses are kept in.
+        response_cache_max_mb (int): Size in megabytes above which the least recently used responses are deleted.
+        stream (bool): Flag indicating whether model responses are streamed and each operation is executed as soon as it is complete.
+        http_preconnect (bool): Flag indicating whether the provider connection is opened while the first screenshot is captured.
+        retry_budget (int): Maximum number of provider attempts per step, across retries and the fallback model.
+        retry_max_delay (float): Upper bound in seconds of the backoff between two attempts.
+        circuit_failure_threshold (int): Consecutive provider failures after which calls to that provider are skipped.
+        circuit_reset_timeout (float): Seconds after which a skipped provider is tried again.
+        structured_output (bool): Flag indicating whether requests use the providers' native structured output for the operation schema.
+        hedge_model (str): Optional model a step is also sent to when the primary model is slow.
+        hedge_percentile (float): Percentile of the primary model's step latency after which the hedge request is sent.
+        hedge_min_samples (int): Number of timed steps needed before the percentile is used.
+        hedge_delay (float): Seconds after which the hedge request is sent until enough requests were timed.
     """
 
     _instance = None
+    # Provider clients, kept on the class so re-running `__init__` doesn't drop them
+    _clients = {}
 
     def __new__(cls):
         if cls._instance is None:
@@ -46,6 +97,96 @@ class Config:
         self.qwen_api_key = (
             None  # instance variables are backups in case saving to a `.env` fails
         )
+        self.ollama_model = os.getenv("OPERATE_OLLAMA_MODEL", "llava")
+        ollama_keep_alive = os.getenv("OPERATE_OLLAMA_KEEP_ALIVE", "30m")
+        # Ollama reads a bare number as seconds, but only if it isn't sent as a string
+        self.ollama_keep_alive = (
+            int(ollama_keep_alive)
+            if ollama_keep_alive.lstrip("-").isdigit()
+            else ollama_keep_alive
+        )
+        self.ollama_options = {
+            option: int(os.environ[variable])
+            for option, variable in (
+                ("num_ctx", "OPERATE_OLLAMA_NUM_CTX"),
+                ("num_thread", "OPERATE_OLLAMA_NUM_THREAD"),
+            )
+            if os.getenv(variable)
+        }
+        self.local_base_url = os.getenv(
+            "OPERATE_LOCAL_BASE_URL", "http://127.0.0.1:8080/v1"
+        )
+        self.local_model = os.getenv("OPERATE_LOCAL_MODEL", "local")
+        self.artifact_level = os.getenv("OPERATE_ARTIFACT_LEVEL")
+        self.artifact_format = os.getenv("OPERATE_ARTIFACT_FORMAT", "png")
+        artifact_compression = os.getenv("OPERATE_ARTIFACT_COMPRESSION")
+        self.artifact_compression = (
+            int(artifact_compression) if artifact_compression else None
+        )
+        self.capture_backend = os.getenv("OPERATE_CAPTURE_BACKEND", "auto")
+        self.settle_timeout = float(os.getenv("OPERATE_SETTLE_TIMEOUT", "2.0"))
+        self.settle_quiet = float(os.getenv("OPERATE_SETTLE_QUIET", "0.25"))
+        self.ocr_languages = os.getenv("OPERATE_OCR_LANGUAGES", "en").split(",")
+        self.ocr_gpu = os.getenv("OPERATE_OCR_GPU", "1") == "1"
+        self.ocr_prewarm = os.getenv("OPERATE_OCR_PREWARM", "1") == "1"
+        self.ocr_cache_size = int(os.getenv("OPERATE_OCR_CACHE_SIZE", "8"))
+        self.ocr_speculative = os.getenv("OPERATE_OCR_SPECULATIVE", "1") == "1"
+        self.ocr_incremental = os.getenv("OPERATE_OCR_INCREMENTAL", "0") == "1"
+        self.ocr_tile_size = int(os.getenv("OPERATE_OCR_TILE_SIZE", "64"))
+        self.ocr_tile_margin = int(os.getenv("OPERATE_OCR_TILE_MARGIN", "16"))
+        self.ocr_incremental_max_dirty = float(
+            os.getenv("OPERATE_OCR_INCREMENTAL_MAX_DIRTY", "0.5")
+        )
+        self.metrics_file = os.getenv("OPERATE_METRICS_FILE")
+        self.yolo_runtime = os.getenv("OPERATE_YOLO_RUNTIME", "torch")
+        self.yolo_int8 = os.getenv("OPERATE_YOLO_INT8", "0") == "1"
+        self.yolo_cache_dir = os.getenv(
+            "OPERATE_YOLO_CACHE_DIR",
+            os.path.join(os.path.expanduser("~"), ".cache", "self-operating-computer"),
+        )
+        self.yolo_prewarm = os.getenv("OPERATE_YOLO_PREWARM", "1") == "1"
+        self.stuck_threshold = int(os.getenv("OPERATE_STUCK_THRESHOLD", "2"))
+        self.stuck_action = os.getenv("OPERATE_STUCK_ACTION", "reprompt")
+        self.stuck_escalation_model = os.getenv(
+            "OPERATE_STUCK_ESCALATION_MODEL", "o1-with-ocr"
+        )
+        self.http_max_connections = int(os.getenv("OPERATE_HTTP_MAX_CONNECTIONS", "10"))
+        self.http_max_keepalive = int(os.getenv("OPERATE_HTTP_MAX_KEEPALIVE", "5"))
+        # Longer than a step, so the connection survives until the next request
+        self.http_keepalive_expiry = float(
+            os.getenv("OPERATE_HTTP_KEEPALIVE_EXPIRY", "120")
+        )
+        self.http_timeout = float(os.getenv("OPERATE_HTTP_TIMEOUT", "600"))
+        self.http_preconnect = os.getenv("OPERATE_HTTP_PRECONNECT", "1") == "1"
+        self.stream = os.getenv("OPERATE_STREAM", "0") == "1"
+        self.response_cache = os.getenv("OPERATE_RESPONSE_CACHE", "off")
+        self.response_cache_dir = os.getenv(
+            "OPERATE_RESPONSE_CACHE_DIR",
+            os.path.join(
+                os.path.expanduser("~"), ".cache", "self-operating-computer", "responses"
+            ),
+        )
+        self.response_cache_max_mb = int(
+            os.getenv("OPERATE_RESPONSE_CACHE_MAX_MB", "512")
+        )
+        self.retry_budget = int(os.getenv("OPERATE_RETRY_BUDGET", "6"))
+        self.retry_max_delay = float(os.getenv("OPERATE_RETRY_MAX_DELAY", "30"))
+        self.circuit_failure_threshold = int(
+            os.getenv("OPERATE_CIRCUIT_FAILURE_THRESHOLD", "3")
+        )
+        self.circuit_reset_timeout = float(
+            os.getenv("OPERATE_CIRCUIT_RESET_TIMEOUT", "60")
+        )
+        self.structured_output = os.getenv("OPERATE_STRUCTURED_OUTPUT", "1") == "1"
+        self.hedge_model = os.getenv("OPERATE_HEDGE_MODEL")
+        self.hedge_percentile = float(os.getenv("OPERATE_HEDGE_PERCENTILE", "90"))
+        self.hedge_min_samples = int(os.getenv("OPERATE_HEDGE_MIN_SAMPLES", "5"))
+        self.hedge_delay = float(os.getenv("OPERATE_HEDGE_DELAY", "15"))
+        self.history_full_images = int(os.getenv("OPERATE_HISTORY_FULL_IMAGES", "2"))
+        self.history_old_images = os.getenv("OPERATE_HISTORY_OLD_IMAGES", "thumbnail")
+        self.history_thumbnail_width = int(
+            os.getenv("OPERATE_HISTORY_THUMBNAIL_WIDTH", "512")
+        )
 
     def initialize_openai(self):
         if self.verbose:
@@ -62,12 +203,18 @@ class Config:
                 )
             api_key = os.getenv("OPENAI_API_KEY")
 
-        client = OpenAI(
-            api_key=api_key,
+        base_url = os.getenv("OPENAI_API_BASE_URL", "https://api.openai.com/v1")
+        return self._get_client(
+            ("openai", base_url, api_key),
+            lambda http_client: AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=http_client,
+                # Retries are handled by operate.utils.retry
+                max_retries=0,
+            ),
+            base_url,
         )
-        client.api_key = api_key
-        client.base_url = os.getenv("OPENAI_API_BASE_URL", client.base_url)
-        return client
 
     def initialize_qwen(self):
         if self.verbose:
@@ -84,13 +231,18 @@ class Config:
                 )
             api_key = os.getenv("QWEN_API_KEY")
 
-        client = OpenAI(
-            api_key=api_key,
-            base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
+        base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
+        return self._get_client(
+            ("qwen", base_url, api_key),
+            lambda http_client: AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=http_client,
+                # Retries are handled by operate.utils.retry
+                max_retries=0,
+            ),
+            base_url,
         )
-        client.api_key = api_key
-        client.base_url = "https://dashscope.aliyuncs.com/compatible-mode/v1"
-        return client
 
     def initialize_google(self):
         if self.google_api_key:
@@ -103,10 +255,11 @@ class Config:
                     "[Config][initialize_google] no cached google_api_key, try to get from env."
                 )
             api_key = os.getenv("GOOGLE_API_KEY")
-        genai.configure(api_key=api_key, transport="rest")
-        model = genai.GenerativeModel("gemini-pro-vision")
-
-        return model
+        key = ("google", api_key)
+        if key not in self._clients:
+            genai.configure(api_key=api_key, transport="rest")
+            self._clients[key] = genai.GenerativeModel("gemini-pro-vision")
+        return self._clients[key]
 
     def initialize_ollama(self):
         if self.ollama_host:
@@ -118,15 +271,63 @@ class Config:
                     "[Config][initialize_ollama] no cached ollama host. Assuming ollama running locally."
                 )
             self.ollama_host = os.getenv("OLLAMA_HOST", None)
-        model = Client(host=self.ollama_host)
-        return model
+        key = ("ollama", self.ollama_host)
+        if key not in self._clients:
+            from operate.utils.connections import get_http_client_options
+
+            # ollama builds its own httpx client, so only hand it the pool settings
+            self._clients[key] = AsyncClient(
+                host=self.ollama_host, **get_http_client_options()
+            )
+        return self._clients[key]
+
+    def initialize_local(self):
+        if self.verbose:
+            print("[Config][initialize_local]", self.local_base_url)
+
+        # llama.cpp and vLLM only check the key if they were started with one
+        api_key = os.getenv("OPERATE_LOCAL_API_KEY", "none")
+        return self._get_client(
+            ("local", self.local_base_url, api_key),
+            lambda http_client: AsyncOpenAI(
+                api_key=api_key,
+                base_url=self.local_base_url,
+                http_client=http_client,
+                # Retries are handled by operate.utils.retry
+                max_retries=0,
+            ),
+            self.local_base_url,
+        )
 
     def initialize_anthropic(self):
         if self.anthropic_api_key:
             api_key = self.anthropic_api_key
         else:
             api_key = os.getenv("ANTHROPIC_API_KEY")
-        return anthropic.Anthropic(api_key=api_key)
+        base_url = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com")
+        return self._get_client(
+            ("anthropic", base_url, api_key),
+            lambda http_client: anthropic.AsyncAnthropic(
+                api_key=api_key,
+                base_url=base_url,
+                http_client=http_client,
+                max_retries=0,
+            ),
+            base_url,
+        )
+
+    def _get_client(self, key, create, base_url):
+        """
+        Returns the cached provider client for `key`, creating it on first use on top
+        of the shared keep-alive pool for `base_url`.
+        """
+        if key not in self._clients:
+            from operate.utils.connections import get_http_client
+
+            if self.verbose:
+                print("[Config][_get_client] creating client for", key[0], base_url)
+            self._clients[key] = create(get_http_client(base_url))
+        return self._clients[key]
 
     def validation(self, model, voice_mode):
         """
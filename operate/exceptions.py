@@ -12,4 +12,54 @@ class ModelNotRecognizedException(Exception):
         super().__init__(self.message)
 
     def __str__(self):
-        return f"{self.message} : {self.model} "
\ No newline at end of file
+        return f"{self.message} : {self.model} "
+
+class MalformedResponseException(Exception):
+    """Exception raised when a streamed model response stops being a valid operation list.
+
+    Attributes:
+        content -- the response text received so far
+        message -- explanation of the error
+    """
+
+    def __init__(self, content, message="Malformed model response"):
+        self.content = content
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message} : {self.content[-200:]} "
+
+
+class ResponseCacheMissException(Exception):
+    """Exception raised in replay mode for a request that was never recorded.
+
+    Attributes:
+        key -- the content address of the request
+        message -- explanation of the error
+    """
+
+    def __init__(self, key, message="No recorded response for request"):
+        self.key = key
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message} : {self.key} "
+
+
+class CircuitOpenException(Exception):
+    """Exception raised when a provider is skipped after repeated failures.
+
+    Attributes:
+        provider -- the provider whose circuit is open
+        message -- explanation of the error
+    """
+
+    def __init__(self, provider, message="Provider circuit is open"):
+        self.provider = provider
+        self.message = message
+        super().__init__(self.message)
+
+    def __str__(self):
+        return f"{self.message} : {self.provider} "
@@ -0,0 +1,511 @@
+"""
+Local stand-in for the model providers, for load and resilience testing without network.
+
+Speaks the OpenAI chat completions (`/v1/chat/completions`), Anthropic messages
+(`/v1/messages`) and Ollama chat (`/api/chat`) protocols, including streaming, and
+answers with operation JSON. Point the clients at it with
+
+    OPENAI_API_BASE_URL=http://127.0.0.1:8800/v1
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8800
+    OLLAMA_HOST=http://127.0.0.1:8800
+    OPERATE_LOCAL_BASE_URL=http://127.0.0.1:8800/v1
+
+Gemini goes through Google's own transport and can't be redirected.
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Error responses by status: OpenAI error type, Anthropic error type
+ERRORS = {
+    429: ("rate_limit_exceeded", "rate_limit_error"),
+    500: ("server_error", "api_error"),
+    503: ("server_error", "overloaded_error"),
+}
+
+
+def parse_distribution(spec):
+    """
+    Returns a function sampling seconds from a latency distribution.
+
+    :param spec: `fixed:S`, `uniform:MIN,MAX`, `normal:MEAN,STD`,
+        `lognormal:MEDIAN,SIGMA` or `exponential:MEAN`.
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    if kind == "exponential":
+        return lambda: random.expovariate(1 / values[0])
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec}")
+
+
+def get_text(content):
+    """
+    Returns the text parts of a message content in any of the supported formats.
+    """
+    if isinstance(content, str):
+        return content
+    return " ".join(
+        part.get("text", "") for part in content or [] if isinstance(part, dict)
+    )
+
+
+class Responder:
+    """
+    Decides the operations for a request.
+
+    Responses come from, in this order: the script entry for the current step, the
+    first rule whose pattern matches the latest user message, and the default
+    behaviour of pressing `shift` until `steps` steps were taken and then `done`.
+    The step is the number of assistant messages in the request, so concurrent
+    sessions each follow the script from the start.
+    """
+
+    def __init__(self, script=None, rules=None, steps=3, malformed_rate=0.0):
+        self.script = script or []
+        self.rules = [(re.compile(rule["match"]), rule["operations"]) for rule in rules or []]
+        self.steps = steps
+        self.malformed_rate = malformed_rate
+
+    def respond(self, messages):
+        step = sum(1 for message in messages if message.get("role") == "assistant")
+        user_text = ""
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                user_text = get_text(message.get("content"))
+                break
+
+        if step < len(self.script):
+            operations = self.script[step]
+        else:
+            operations = next(
+                (ops for pattern, ops in self.rules if pattern.search(user_text)), None
+            )
+        if operations is None:
+            if step + 1 >= self.steps:
+                operations = [
+                    {
+                        "thought": "The mock session is complete",
+                        "operation": "done",
+                        "summary": f"Finished after {step + 1} steps",
+                    }
+                ]
+            else:
+                operations = [
+                    {
+                        "thought": f"Mock step {step + 1}",
+                        "operation": "press",
+                        "keys": ["shift"],
+                    }
+                ]
+
+        # Scripted strings are served verbatim, e.g. to test broken responses
+        text = operations if isinstance(operations, str) else json.dumps(operations)
+        if random.random() < self.malformed_rate:
+            text = text[: max(1, len(text) // 2)]
+        return text
+
+
+def wrap_operations(text):
+    """
+    Wraps an operation list in the `{"operations": [...]}` object of structured output.
+    """
+    try:
+        operations = json.loads(text)
+    except ValueError:
+        return text
+    if isinstance(operations, list):
+        return json.dumps({"operations": operations})
+    return text
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_HEAD(self):
+        # Preconnect requests only need the connection
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self.send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self.send_json(400, {"error": "Invalid JSON"})
+            return
+
+        path = self.path.split("?", 1)[0]
+        if path == "/api/generate":
+            # Ollama loads the model for an empty prompt, which is all operate sends
+            self.send_json(
+                200,
+                {"model": body.get("model", "mock"), "response": "", "done": True},
+            )
+            return
+        if path.endswith("/chat/completions"):
+            protocol = "openai"
+        elif path.endswith("/messages"):
+            protocol = "anthropic"
+        elif path == "/api/chat":
+            protocol = "ollama"
+        else:
+            self.send_json(404, {"error": f"Unknown path {path}"})
+            return
+
+        server = self.server
+        server.count_request(protocol)
+        time.sleep(server.latency())
+        if random.random() < server.error_rate:
+            self.send_error_response(protocol, random.choice(server.error_statuses))
+            return
+
+        messages = body.get("messages", [])
+        text = server.responder.respond(messages)
+        if body.get("response_format") or body.get("tools") or body.get("format"):
+            text = wrap_operations(text)
+        model = body.get("model", "mock")
+        input_tokens = sum(len(get_text(m.get("content"))) for m in messages) // 4
+        # Ollama streams unless it was asked not to
+        stream = body.get("stream", protocol == "ollama")
+        if protocol == "anthropic":
+            # A forced tool call answers with the tool's input
+            tool = body["tools"][0]["name"] if body.get("tools") else None
+            try:
+                json.loads(text)
+            except ValueError:
+                tool = None  # malformed responses are sent as text
+            if stream:
+                self.stream_anthropic(model, text, input_tokens, tool)
+            else:
+                self.send_json(200, self.get_anthropic_response(model, text, input_tokens, tool))
+        elif stream:
+            getattr(self, f"stream_{protocol}")(model, text, input_tokens)
+        else:
+            self.send_json(200, getattr(self, f"get_{protocol}_response")(model, text, input_tokens))
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_response(self, protocol, status):
+        openai_type, anthropic_type = ERRORS.get(status, ("server_error", "api_error"))
+        message = f"Mock error {status}"
+        if protocol == "openai":
+            payload = {"error": {"message": message, "type": openai_type, "code": status}}
+        elif protocol == "anthropic":
+            payload = {"type": "error", "error": {"type": anthropic_type, "message": message}}
+        else:
+            payload = {"error": message}
+        headers = {"Retry-After": "1"} if status == 429 else None
+        self.send_json(status, payload, headers)
+
+    def get_openai_response(self, model, text, input_tokens):
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": text},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": input_tokens + len(text) // 4,
+            },
+        }
+
+    def get_anthropic_response(self, model, text, input_tokens, tool=None):
+        if tool:
+            content = [
+                {
+                    "type": "tool_use",
+                    "id": f"toolu_{uuid.uuid4().hex}",
+                    "name": tool,
+                    "input": json.loads(text),
+                }
+            ]
+        else:
+            content = [{"type": "text", "text": text}]
+        return {
+            "id": f"msg_{uuid.uuid4().hex}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": content,
+            "stop_reason": "tool_use" if tool else "end_turn",
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": len(text) // 4},
+        }
+
+    def get_ollama_response(self, model, text, input_tokens):
+        return {
+            "model": model,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "message": {"role": "assistant", "content": text},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": input_tokens,
+            "eval_count": len(text) // 4,
+        }
+
+    def start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def write_chunk(self, data):
+        data = data.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("utf-8") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def get_text_chunks(self, text):
+        size = self.server.chunk_size
+        for index in range(0, len(text), size):
+            if index:
+                time.sleep(self.server.chunk_delay)
+            yield text[index : index + size]
+
+    def stream_openai(self, model, text, input_tokens):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def event(choices, usage=None):
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": choices,
+            }
+            if usage:
+                payload["usage"] = usage
+            self.write_chunk(f"data: {json.dumps(payload)}\n\n")
+
+        self.start_stream("text/event-stream")
+        for chunk in self.get_text_chunks(text):
+            event(
+                [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": chunk},
+                        "finish_reason": None,
+                    }
+                ]
+            )
+        event([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        event(
+            [],
+            {
+                "prompt_tokens": input_tokens,
+                "completion_tokens": len(text) // 4,
+                "total_tokens": input_tokens + len(text) // 4,
+            },
+        )
+        self.write_chunk("data: [DONE]\n\n")
+        self.end_stream()
+
+    def stream_anthropic(self, model, text, input_tokens, tool=None):
+        def event(name, payload):
+            payload = {"type": name, **payload}
+            self.write_chunk(f"event: {name}\ndata: {json.dumps(payload)}\n\n")
+
+        self.start_stream("text/event-stream")
+        message = self.get_anthropic_response(model, "", input_tokens)
+        message["content"] = []
+        message["stop_reason"] = None
+        message["usage"]["output_tokens"] = 1
+        event("message_start", {"message": message})
+        if tool:
+            block = {"type": "tool_use", "id": f"toolu_{uuid.uuid4().hex}", "name": tool, "input": {}}
+        else:
+            block = {"type": "text", "text": ""}
+        event("content_block_start", {"index": 0, "content_block": block})
+        for chunk in self.get_text_chunks(text):
+            if tool:
+                delta = {"type": "input_json_delta", "partial_json": chunk}
+            else:
+                delta = {"type": "text_delta", "text": chunk}
+            event("content_block_delta", {"index": 0, "delta": delta})
+        event("content_block_stop", {"index": 0})
+        event(
+            "message_delta",
+            {
+                "delta": {
+                    "stop_reason": "tool_use" if tool else "end_turn",
+                    "stop_sequence": None,
+                },
+                "usage": {"output_tokens": len(text) // 4},
+            },
+        )
+        event("message_stop", {})
+        self.end_stream()
+
+    def stream_ollama(self, model, text, input_tokens):
+        self.start_stream("application/x-ndjson")
+        for chunk in self.get_text_chunks(text):
+            payload = self.get_ollama_response(model, chunk, input_tokens)
+            payload["done"] = False
+            for name in ("done_reason", "prompt_eval_count", "eval_count"):
+                del payload[name]
+            self.write_chunk(json.dumps(payload) + "\n")
+        self.write_chunk(json.dumps(self.get_ollama_response(model, "", input_tokens)) + "\n")
+        self.end_stream()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        responder,
+        latency,
+        error_rate=0.0,
+        error_statuses=(429, 500, 503),
+        chunk_size=16,
+        chunk_delay=0.02,
+        verbose=False,
+    ):
+        super().__init__(address, MockHandler)
+        self.responder = responder
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_statuses = list(error_statuses)
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.verbose = verbose
+        self.requests = {}
+        self._lock = threading.Lock()
+
+    def count_request(self, protocol):
+        with self._lock:
+            self.requests[protocol] = self.requests.get(protocol, 0) + 1
+
+
+def load_json(file_path):
+    with open(file_path) as file:
+        return json.load(file)
+
+
+def main_entry():
+    parser = argparse.ArgumentParser(
+        description="Run a local stand-in for the OpenAI, Anthropic and Ollama APIs."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument(
+        "--script",
+        help="JSON file with a list of responses, one per step. Each is an operation list, or a string sent verbatim",
+    )
+    parser.add_argument(
+        "--rules",
+        help='JSON file with a list of {"match": regex, "operations": [...]} applied to the latest user message',
+    )
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=3,
+        help="Step after which the default responses say `done`",
+    )
+    parser.add_argument(
+        "--latency",
+        type=parse_distribution,
+        default="fixed:0",
+        help="Response latency in seconds: fixed:S, uniform:MIN,MAX, normal:MEAN,STD, lognormal:MEDIAN,SIGMA or exponential:MEAN",
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fraction of requests that fail"
+    )
+    parser.add_argument(
+        "--error-status",
+        default="429,500,503",
+        help="Comma separated HTTP statuses failed requests are answered with",
+    )
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of responses that are cut off half way",
+    )
+    parser.add_argument(
+        "--chunk-size", type=int, default=16, help="Characters per streamed chunk"
+    )
+    parser.add_argument(
+        "--chunk-delay",
+        type=float,
+        default=0.02,
+        help="Seconds between streamed chunks",
+    )
+    parser.add_argument(
+        "--verbose", help="Log every request", action="store_true"
+    )
+    args = parser.parse_args()
+
+    responder = Responder(
+        script=load_json(args.script) if args.script else None,
+        rules=load_json(args.rules) if args.rules else None,
+        steps=args.steps,
+        malformed_rate=args.malformed_rate,
+    )
+    server = MockServer(
+        (args.host, args.port),
+        responder,
+        args.latency,
+        error_rate=args.error_rate,
+        error_statuses=[int(status) for status in args.error_status.split(",")],
+        chunk_size=args.chunk_size,
+        chunk_delay=args.chunk_delay,
+        verbose=args.verbose,
+    )
+    print(
+        f"[operate-mock-llm] Listening on http://{args.host}:{args.port}"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[operate-mock-llm] Requests: {server.requests}")
+
+
+if __name__ == "__main__":
+    main_entry()
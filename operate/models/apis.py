@@ -1,1063 +1,531 @@
+import asyncio
 import base64
-import io
 import json
-import os
 import time
 import traceback
 
-import easyocr
-import ollama
-import pkg_resources
-from PIL import Image
-from ultralytics import YOLO
-
 from operate.config import Config
-from operate.exceptions import ModelNotRecognizedException
+from operate.exceptions import MalformedResponseException
 from operate.models.prompts import (
     get_system_prompt,
     get_user_first_message_prompt,
     get_user_prompt,
 )
+from operate.models.providers import PROVIDERS, get_provider
 from operate.utils.label import (
     add_labels,
-    get_click_position_in_percent,
-    get_label_coordinates,
+    get_label_position,
+    get_yolo_model,
+)
+from operate.utils.ocr import (
+    get_text_coordinates,
+    get_text_element,
+    read_text,
+    read_text_async,
 )
-from operate.utils.ocr import get_text_coordinates, get_text_element
-from operate.utils.screenshot import capture_screen_with_cursor, compress_screenshot
+from operate.utils.metrics import metrics
+from operate.utils.parse import parse_operations
+from operate.utils.retry import RetryBudget, call_with_retries, classify_error
+from operate.utils.screenshot import capture_frame
+from operate.utils.settle import wait_for_screen_settle
+from operate.utils.stream import OperationStreamParser
 from operate.utils.style import ANSI_BRIGHT_MAGENTA, ANSI_GREEN, ANSI_RED, ANSI_RESET
 
 # Load configuration
 config = Config()
 
+# Models that locate click targets with OCR
+OCR_MODELS = [
+    model for model, provider in PROVIDERS.items() if provider.grounding == "ocr"
+]
+
+# Model a failed step is retried on
+FALLBACK_MODEL = "gpt-4"
+
+# Models whose failed steps are not retried on the fallback model
+NO_FALLBACK_MODELS = ["gpt-4", "llava", "ollama", "local"]
+
 
-async def get_next_action(model, messages, objective, session_id):
+async def get_next_action(model, messages, objective, session_id, frame=None, hint=None):
     if config.verbose:
         print("[Self-Operating Computer][get_next_action]")
         print("[Self-Operating Computer][get_next_action] model", model)
-    if model == "gpt-4":
-        return call_gpt_4o(messages), None
-    if model == "qwen-vl":
-        operation = await call_qwen_vl_with_ocr(messages, objective, model)
-        return operation, None
-    if model == "gpt-4-with-som":
-        operation = await call_gpt_4o_labeled(messages, objective, model)
-        return operation, None
-    if model == "gpt-4-with-ocr":
-        operation = await call_gpt_4o_with_ocr(messages, objective, model)
-        return operation, None
-    if model == "gpt-4.1-with-ocr":
-        operation = await call_gpt_4_1_with_ocr(messages, objective, model)
-        return operation, None
-    if model == "o1-with-ocr":
-        operation = await call_o1_with_ocr(messages, objective, model)
-        return operation, None
     if model == "agent-1":
         return "coming soon"
-    if model == "gemini-pro-vision":
-        return call_gemini_pro_vision(messages, objective), None
-    if model == "llava":
-        operation = call_ollama_llava(messages)
-        return operation, None
-    if model == "claude-3":
-        operation = await call_claude_3_with_ocr(messages, objective, model)
-        return operation, None
-    raise ModelNotRecognizedException(model)
-
-
-def call_gpt_4o(messages):
-    if config.verbose:
-        print("[call_gpt_4_v]")
-    time.sleep(1)
-    client = config.initialize_openai()
+    provider = get_provider(model)
+    if frame is None:
+        # capture the one frame that every path below (including fallbacks) works from
+        frame = await capture_step_frame()
+    if config.ocr_speculative and provider.grounding == "ocr":
+        # Start OCR now so it runs while the model request is in flight;
+        # click resolution below joins the running read
+        read_text_async(frame)
+
+    budget = RetryBudget(config.retry_budget)
     try:
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
-
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
-
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
+        if config.hedge_model and config.hedge_model != model:
+            operations = await hedge_step(model, messages, objective, frame, hint, budget)
         else:
-            user_prompt = get_user_prompt()
-
-        if config.verbose:
-            print(
-                "[call_gpt_4_v] user_prompt",
-                user_prompt,
-            )
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"},
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            presence_penalty=1,
-            frequency_penalty=1,
-        )
-
-        content = response.choices[0].message.content
-
-        content = clean_json(content)
-
-        assistant_message = {"role": "assistant", "content": content}
-        if config.verbose:
-            print(
-                "[call_gpt_4_v] content",
-                content,
+            operations = await call_with_retries(
+                provider.name,
+                lambda: run_step(model, messages, objective, frame, hint),
+                budget,
+                messages,
             )
-        content = json.loads(content)
-
-        messages.append(assistant_message)
-
-        return content
-
+        return operations, None
     except Exception as e:
+        if model in NO_FALLBACK_MODELS or classify_error(e) == "fatal":
+            raise
+        if budget.remaining <= 0:
+            raise
         print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[Operate] That did not work. Trying again {ANSI_RESET}",
-            e,
-        )
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] AI response was {ANSI_RESET}",
-            content,
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
         )
         if config.verbose:
+            print("[Self-Operating Computer][Operate] error", e)
             traceback.print_exc()
-        return call_gpt_4o(messages)
-
-
-async def call_qwen_vl_with_ocr(messages, objective, model):
-    if config.verbose:
-        print("[call_qwen_vl_with_ocr]")
-
-    # Construct the path to the file within the package
-    try:
-        time.sleep(1)
-        client = config.initialize_qwen()
-
-        confirm_system_prompt(messages, objective, model)
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        # Call the function to capture the screen with the cursor
-        raw_screenshot_filename = os.path.join(screenshots_dir, "raw_screenshot.png")
-        capture_screen_with_cursor(raw_screenshot_filename)
-
-        # Compress screenshot image to make size be smaller
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.jpeg")
-        compress_screenshot(raw_screenshot_filename, screenshot_filename)
-
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
 
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
-        else:
-            user_prompt = get_user_prompt()
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {"type": "text",
-                 "text": f"{user_prompt}**REMEMBER** Only output json format, do not append any other text."},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"},
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        response = client.chat.completions.create(
-            model="qwen2.5-vl-72b-instruct",
-            messages=messages,
-        )
-
-        content = response.choices[0].message.content
+    if provider.name == "anthropic":
+        fallback_messages = convert_messages_to_openai(messages)
+    else:
+        fallback_messages = messages
+    operations = await call_with_retries(
+        get_provider(FALLBACK_MODEL).name,
+        lambda: run_step(FALLBACK_MODEL, fallback_messages, objective, frame, hint),
+        budget,
+        fallback_messages,
+    )
+    return operations, None
 
-        content = clean_json(content)
 
-        # used later for the messages
-        content_str = content
-
-        content = json.loads(content)
-
-        processed_content = []
+def get_hedge_deadline(model):
+    """
+    Returns the seconds to wait for `model` before hedging: the configured percentile
+    of its step latency, or `config.hedge_delay` until enough steps were timed.
 
-        for operation in content:
-            if operation.get("operation") == "click":
-                text_to_click = operation.get("text")
-                if config.verbose:
-                    print(
-                        "[call_qwen_vl_with_ocr][click] text_to_click",
-                        text_to_click,
-                    )
-                # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
+    The samples come from `hedge_step` and include the steps that were cancelled or
+    failed with the time they ran, a lower bound of how long they would have taken.
+    Timing only the requests that succeeded would drop the slow ones and pull the
+    deadline down with every hedge.
+    """
+    name = f"hedge.latency.{model}"
+    if metrics.count(name) < config.hedge_min_samples:
+        return config.hedge_delay
+    return metrics.percentile(name, config.hedge_percentile)
 
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
 
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
-
-                # add `coordinates`` to `content`
-                operation["x"] = coordinates["x"]
-                operation["y"] = coordinates["y"]
-
-                if config.verbose:
-                    print(
-                        "[call_qwen_vl_with_ocr][click] text_element_index",
-                        text_element_index,
-                    )
-                    print(
-                        "[call_qwen_vl_with_ocr][click] coordinates",
-                        coordinates,
-                    )
-                    print(
-                        "[call_qwen_vl_with_ocr][click] final operation",
-                        operation,
-                    )
-                processed_content.append(operation)
+def convert_messages(messages, model, target_model):
+    """
+    Returns a copy of the message history of `model` in the format `target_model`
+    reads. Histories that can't be converted are reduced to the system prompt.
+    """
+    source_format = get_provider(model).message_format
+    target_format = get_provider(target_model).message_format
+    if source_format == target_format:
+        return list(messages)
+    if target_format == "openai":
+        return convert_messages_to_openai(messages)
+    return [messages[0]]
 
-            else:
-                processed_content.append(operation)
 
-        # wait to append the assistant message so that if the `processed_content` step fails we don't append a message and mess up message history
-        assistant_message = {"role": "assistant", "content": content_str}
-        messages.append(assistant_message)
+def record_converted_step(messages, step_messages):
+    """
+    Records a step that ran on a converted copy of the history in the original
+    history: the user prompt as text, since its screenshot is in the other model's
+    format, and the answer.
 
-        return processed_content
+    :param messages: The session's history.
+    :param step_messages: The messages the step added to the converted copy.
+    """
+    user = next((m for m in step_messages if m["role"] == "user"), None)
+    assistant = next(
+        (m for m in reversed(step_messages) if m["role"] == "assistant"), None
+    )
+    if user is None or assistant is None:
+        return
+    messages.append({"role": "user", "content": get_message_text(user)})
+    messages.append({"role": "assistant", "content": assistant["content"]})
 
-    except Exception as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
-        )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-        return gpt_4_fallback(messages, objective, model)
 
-def call_gemini_pro_vision(messages, objective):
+async def hedge_step(model, messages, objective, frame, hint, budget):
     """
-    Get the next action for Self-Operating Computer using Gemini Pro Vision
+    Runs a step on `model` and, if it hasn't answered by its hedge deadline, races the
+    same step on `config.hedge_model`. The first valid operation list wins and the
+    other request is cancelled.
+
+    The hedge works on a copy of the message history. If it wins, the primary's user
+    message is kept and the hedge's answer is recorded as the assistant message, so the
+    history stays in the primary model's format.
+
+    Metrics:
+        hedge.deadline: gauge of the last deadline in seconds.
+        hedge.skipped: steps the primary answered before the deadline.
+        hedge.started: steps that issued the hedge request.
+        hedge.won.primary / hedge.won.hedge: which request a hedged step used.
+        hedge.failed: hedged steps where both requests failed.
+        hedge.primary / hedge.hedge: step latency in seconds by winning request.
+        hedge.latency.<model>: time the primary ran, until it answered, failed or was
+            cancelled, which the deadline is derived from.
     """
-    if config.verbose:
-        print(
-            "[Self Operating Computer][call_gemini_pro_vision]",
+    provider = get_provider(model)
+    hedge_provider = get_provider(config.hedge_model)
+    message_count = len(messages)
+    start = time.perf_counter()
+    primary = asyncio.create_task(
+        call_with_retries(
+            provider.name,
+            lambda: run_step(model, messages, objective, frame, hint),
+            budget,
+            messages,
         )
-    # sleep for a second
-    time.sleep(1)
-    try:
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
-        # sleep for a second
-        time.sleep(1)
-        prompt = get_system_prompt("gemini-pro-vision", objective)
-
-        model = config.initialize_google()
-        if config.verbose:
-            print("[call_gemini_pro_vision] model", model)
-
-        response = model.generate_content([prompt, Image.open(screenshot_filename)])
-
-        content = response.text[1:]
-        if config.verbose:
-            print("[call_gemini_pro_vision] response", response)
-            print("[call_gemini_pro_vision] content", content)
-
-        content = json.loads(content)
-        if config.verbose:
-            print(
-                "[get_next_action][call_gemini_pro_vision] content",
-                content,
-            )
-
-        return content
-
-    except Exception as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[Operate] That did not work. Trying another method {ANSI_RESET}"
+    )
+    primary.add_done_callback(
+        lambda task: metrics.observe(
+            f"hedge.latency.{model}", time.perf_counter() - start
         )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-        return call_gpt_4o(messages)
+    )
 
+    deadline = get_hedge_deadline(model)
+    metrics.set_gauge("hedge.deadline", deadline)
+    done, _ = await asyncio.wait({primary}, timeout=deadline)
+    if done:
+        metrics.increment("hedge.skipped")
+        return primary.result()
 
-async def call_gpt_4o_with_ocr(messages, objective, model):
+    metrics.increment("hedge.started")
     if config.verbose:
-        print("[call_gpt_4o_with_ocr]")
-
-    # Construct the path to the file within the package
-    try:
-        time.sleep(1)
-        client = config.initialize_openai()
-
-        confirm_system_prompt(messages, objective, model)
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
-
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
-
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
-        else:
-            user_prompt = get_user_prompt()
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"},
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-        )
-
-        content = response.choices[0].message.content
-
-        content = clean_json(content)
-
-        # used later for the messages
-        content_str = content
-
-        content = json.loads(content)
-
-        processed_content = []
-
-        for operation in content:
-            if operation.get("operation") == "click":
-                text_to_click = operation.get("text")
-                if config.verbose:
-                    print(
-                        "[call_gpt_4o_with_ocr][click] text_to_click",
-                        text_to_click,
-                    )
-                # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
-
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
-
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
-
-                # add `coordinates`` to `content`
-                operation["x"] = coordinates["x"]
-                operation["y"] = coordinates["y"]
-
-                if config.verbose:
-                    print(
-                        "[call_gpt_4o_with_ocr][click] text_element_index",
-                        text_element_index,
-                    )
-                    print(
-                        "[call_gpt_4o_with_ocr][click] coordinates",
-                        coordinates,
-                    )
-                    print(
-                        "[call_gpt_4o_with_ocr][click] final operation",
-                        operation,
-                    )
-                processed_content.append(operation)
-
-            else:
-                processed_content.append(operation)
-
-        # wait to append the assistant message so that if the `processed_content` step fails we don't append a message and mess up message history
-        assistant_message = {"role": "assistant", "content": content_str}
-        messages.append(assistant_message)
-
-        return processed_content
-
-    except Exception as e:
         print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
+            f"[hedge_step] {model} did not answer within {deadline:.2f}s, also asking {config.hedge_model}"
         )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-        return gpt_4_fallback(messages, objective, model)
-
-
-async def call_gpt_4_1_with_ocr(messages, objective, model):
-    if config.verbose:
-        print("[call_gpt_4_1_with_ocr]")
-
-    try:
-        time.sleep(1)
-        client = config.initialize_openai()
-
-        confirm_system_prompt(messages, objective, model)
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        capture_screen_with_cursor(screenshot_filename)
-
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
-
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
-        else:
-            user_prompt = get_user_prompt()
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"},
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        response = client.chat.completions.create(
-            model="gpt-4.1",
-            messages=messages,
+    hedge_messages = convert_messages(messages, model, config.hedge_model)
+    hedge = asyncio.create_task(
+        call_with_retries(
+            hedge_provider.name,
+            lambda: run_step(config.hedge_model, hedge_messages, objective, frame, hint),
+            RetryBudget(config.retry_budget),
+            hedge_messages,
         )
+    )
 
-        content = response.choices[0].message.content
-
-        content = clean_json(content)
-
-        content_str = content
-
-        content = json.loads(content)
-
-        processed_content = []
-
-        for operation in content:
-            if operation.get("operation") == "click":
-                text_to_click = operation.get("text")
-                if config.verbose:
-                    print(
-                        "[call_gpt_4_1_with_ocr][click] text_to_click",
-                        text_to_click,
-                    )
-                reader = easyocr.Reader(["en"])
-
-                result = reader.readtext(screenshot_filename)
-
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
-                )
-
-                operation["x"] = coordinates["x"]
-                operation["y"] = coordinates["y"]
-
-                if config.verbose:
-                    print(
-                        "[call_gpt_4_1_with_ocr][click] text_element_index",
-                        text_element_index,
-                    )
-                    print(
-                        "[call_gpt_4_1_with_ocr][click] coordinates",
-                        coordinates,
-                    )
-                    print(
-                        "[call_gpt_4_1_with_ocr][click] final operation",
-                        operation,
-                    )
-                processed_content.append(operation)
-
-            else:
-                processed_content.append(operation)
-
-        assistant_message = {"role": "assistant", "content": content_str}
-        messages.append(assistant_message)
-
-        return processed_content
-
-    except Exception as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
-        )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-        return gpt_4_fallback(messages, objective, model)
-
-
-async def call_o1_with_ocr(messages, objective, model):
-    if config.verbose:
-        print("[call_o1_with_ocr]")
-
-    # Construct the path to the file within the package
+    pending = {primary, hedge}
+    winner = None
     try:
-        time.sleep(1)
-        client = config.initialize_openai()
-
-        confirm_system_prompt(messages, objective, model)
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
-
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
-
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
+        while pending and winner is None:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    break
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if winner is None:
+        metrics.increment("hedge.failed")
+        raise primary.exception()
+
+    name = "primary" if winner is primary else "hedge"
+    metrics.increment(f"hedge.won.{name}")
+    metrics.observe(f"hedge.{name}", time.perf_counter() - start)
+    if winner is hedge:
+        # Keep the primary's user message, if it got that far, and answer it with the
+        # hedge's operations
+        del messages[message_count + 1 :]
+        if len(messages) > message_count and messages[-1]["role"] == "user":
+            provider.after_request(messages)
+            messages.append(hedge_messages[-1])
         else:
-            user_prompt = get_user_prompt()
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{img_base64}"},
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        response = client.chat.completions.create(
-            model="o1",
-            messages=messages,
-        )
-
-        content = response.choices[0].message.content
+            del messages[message_count:]
+    return winner.result()
 
-        content = clean_json(content)
 
-        # used later for the messages
-        content_str = content
+async def capture_step_frame():
+    """
+    Waits for the previous operations to take effect, then captures the frame a step
+    works from.
+    """
+    with metrics.timer("stage.capture"):
+        await asyncio.to_thread(wait_for_screen_settle)
+        return await asyncio.to_thread(capture_frame)
 
-        content = json.loads(content)
 
-        processed_content = []
+async def run_step(model, messages, objective, frame, hint=None):
+    """
+    Makes one request to `model` and returns its operations, with click targets
+    already located on `frame`.
 
-        for operation in content:
-            if operation.get("operation") == "click":
-                text_to_click = operation.get("text")
-                if config.verbose:
-                    print(
-                        "[call_o1_with_ocr][click] text_to_click",
-                        text_to_click,
-                    )
-                # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
+    Every model goes through the same stages, each recorded as a `stage.*` timing:
+    `preprocess` (system prompt, screenshot encoding, user message), `request`,
+    `parse` and `ground`. Errors are raised to the caller, which decides whether to
+    retry; the assistant message is only appended once every stage succeeded.
+    """
+    provider = get_provider(model)
+    if config.verbose:
+        print("[run_step] model", model, "provider", provider.name, provider.model)
+    label_positions = await prepare_step(provider, model, messages, objective, frame, hint)
 
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
+    start = time.perf_counter()
+    content = await provider.request(messages)
+    metrics.observe("stage.request", time.perf_counter() - start)
+    # Per model request latency
+    metrics.observe(f"request.{model}", time.perf_counter() - start)
+    provider.after_request(messages)
 
-                text_element_index = get_text_element(
-                    result, text_to_click, screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
+    with metrics.timer("stage.parse"):
+        try:
+            operations, repairs = parse_operations(content)
+        except MalformedResponseException as e:
+            # Nothing to recover locally, so `call_with_retries` asks again
+            metrics.increment("parse.failed")
+            if config.verbose:
+                print(
+                    f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] {e} {ANSI_RESET}"
                 )
-
-                # add `coordinates`` to `content`
-                operation["x"] = coordinates["x"]
-                operation["y"] = coordinates["y"]
-
-                if config.verbose:
-                    print(
-                        "[call_o1_with_ocr][click] text_element_index",
-                        text_element_index,
-                    )
-                    print(
-                        "[call_o1_with_ocr][click] coordinates",
-                        coordinates,
-                    )
-                    print(
-                        "[call_o1_with_ocr][click] final operation",
-                        operation,
-                    )
-                processed_content.append(operation)
-
-            else:
-                processed_content.append(operation)
-
-        # wait to append the assistant message so that if the `processed_content` step fails we don't append a message and mess up message history
-        assistant_message = {"role": "assistant", "content": content_str}
-        messages.append(assistant_message)
-
-        return processed_content
-
-    except Exception as e:
+            raise
+    if repairs:
+        metrics.increment("parse.repaired")
+        for repair in repairs:
+            metrics.increment(f"parse.repair.{repair}")
+    if config.verbose:
         print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] content: {content} {ANSI_RESET}"
         )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-        return gpt_4_fallback(messages, objective, model)
+        if repairs:
+            print("[run_step] repaired", sorted(repairs))
+    # Keep the clean list in the history, so the model doesn't see its own defects
+    content = json.dumps(operations)
 
+    with metrics.timer("stage.ground"):
+        for operation in operations:
+            await ground_operation(provider, operation, frame, label_positions)
 
-async def call_gpt_4o_labeled(messages, objective, model):
-    time.sleep(1)
+    messages.append({"role": "assistant", "content": content})
+    return operations
 
-    try:
-        client = config.initialize_openai()
-
-        confirm_system_prompt(messages, objective, model)
-        file_path = pkg_resources.resource_filename("operate.models.weights", "best.pt")
-        yolo_model = YOLO(file_path)  # Load your trained model
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
 
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
+async def prepare_step(provider, model, messages, objective, frame, hint=None):
+    """
+    Preprocess stage: confirms the system prompt and appends the user message with the
+    encoded screenshot, labeled first if the model clicks on set-of-mark labels.
 
-        with open(screenshot_filename, "rb") as img_file:
-            img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
+    Returns:
+    The label positions of a labeled screenshot, or None.
+    """
+    with metrics.timer("stage.preprocess"):
+        confirm_system_prompt(messages, objective, model)
 
-        img_base64_labeled, label_coordinates = add_labels(img_base64, yolo_model)
+        label_positions = None
+        if provider.grounding == "labels":
+            yolo_model = await asyncio.to_thread(get_yolo_model)  # Loaded once per process
+            image, label_positions = await asyncio.to_thread(
+                add_labels, frame.image, yolo_model
+            )
+        else:
+            image = await asyncio.to_thread(provider.encode_image, frame)
 
         if len(messages) == 1:
             user_prompt = get_user_first_message_prompt()
         else:
-            user_prompt = get_user_prompt()
-
+            user_prompt = get_user_prompt(hint)
         if config.verbose:
-            print(
-                "[call_gpt_4_vision_preview_labeled] user_prompt",
-                user_prompt,
-            )
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {"type": "text", "text": user_prompt},
-                {
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/jpeg;base64,{img_base64_labeled}"
-                    },
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            presence_penalty=1,
-            frequency_penalty=1,
-        )
+            print("[prepare_step] user_prompt", user_prompt)
 
-        content = response.choices[0].message.content
+        messages.append(provider.build_message(user_prompt, image, hint))
+    return label_positions
 
-        content = clean_json(content)
-
-        assistant_message = {"role": "assistant", "content": content}
-
-        messages.append(assistant_message)
-
-        content = json.loads(content)
-        if config.verbose:
-            print(
-                "[call_gpt_4_vision_preview_labeled] content",
-                content,
-            )
 
-        processed_content = []
-
-        for operation in content:
-            print(
-                "[call_gpt_4_vision_preview_labeled] for operation in content",
-                operation,
-            )
-            if operation.get("operation") == "click":
-                label = operation.get("label")
-                if config.verbose:
-                    print(
-                        "[Self Operating Computer][call_gpt_4_vision_preview_labeled] label",
-                        label,
-                    )
-
-                coordinates = get_label_coordinates(label, label_coordinates)
-                if config.verbose:
-                    print(
-                        "[Self Operating Computer][call_gpt_4_vision_preview_labeled] coordinates",
-                        coordinates,
-                    )
-                image = Image.open(
-                    io.BytesIO(base64.b64decode(img_base64))
-                )  # Load the image to get its size
-                image_size = image.size  # Get the size of the image (width, height)
-                click_position_percent = get_click_position_in_percent(
-                    coordinates, image_size
-                )
-                if config.verbose:
-                    print(
-                        "[Self Operating Computer][call_gpt_4_vision_preview_labeled] click_position_percent",
-                        click_position_percent,
-                    )
-                if not click_position_percent:
-                    print(
-                        f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] Failed to get click position in percent. Trying another method {ANSI_RESET}"
-                    )
-                    return call_gpt_4o(messages)
-
-                x_percent = f"{click_position_percent[0]:.2f}"
-                y_percent = f"{click_position_percent[1]:.2f}"
-                operation["x"] = x_percent
-                operation["y"] = y_percent
-                if config.verbose:
-                    print(
-                        "[Self Operating Computer][call_gpt_4_vision_preview_labeled] new click operation",
-                        operation,
-                    )
-                processed_content.append(operation)
-            else:
-                if config.verbose:
-                    print(
-                        "[Self Operating Computer][call_gpt_4_vision_preview_labeled] .append none click operation",
-                        operation,
-                    )
-
-                processed_content.append(operation)
+async def stream_next_action(model, messages, objective, frame, hint=None):
+    """
+    Streaming counterpart of `get_next_action`.
 
-            if config.verbose:
-                print(
-                    "[Self Operating Computer][call_gpt_4_vision_preview_labeled] new processed_content",
-                    processed_content,
-                )
-            return processed_content
+    Yields each operation as soon as its JSON object is complete, with its click
+    target already located, so the first one can be executed while the model is
+    still writing the rest. Raises `MalformedResponseException` if the response
+    breaks off or stops being an operation list after some operations were
+    yielded; only the operations that were yielded are kept in the message history.
 
-    except Exception as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
+    Providers that can't stream, and streams that fail before the first operation,
+    go through `get_next_action` instead.
+    """
+    provider = get_provider(model)
+    if not provider.can_stream:
+        operations, _ = await get_next_action(
+            model, messages, objective, None, frame, hint
         )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-        return call_gpt_4o(messages)
+        for operation in operations:
+            yield operation
+        return
 
-
-def call_ollama_llava(messages):
     if config.verbose:
-        print("[call_ollama_llava]")
-    time.sleep(1)
-    try:
-        model = config.initialize_ollama()
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
+        print("[stream_next_action] model", model)
+    if config.ocr_speculative and provider.grounding == "ocr":
+        read_text_async(frame)
 
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        # Call the function to capture the screen with the cursor
-        capture_screen_with_cursor(screenshot_filename)
-
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
-        else:
-            user_prompt = get_user_prompt()
+    message_count = len(messages)
+    label_positions = await prepare_step(provider, model, messages, objective, frame, hint)
+    chunks = provider.stream(messages)
 
+    parser = OperationStreamParser()
+    yielded = []
+    start = time.perf_counter()
+    try:
+        async for chunk in chunks:
+            for operation in parser.feed(chunk):
+                with metrics.timer("stage.ground"):
+                    await ground_operation(provider, operation, frame, label_positions)
+                if not yielded:
+                    metrics.observe("stream.first_operation", time.perf_counter() - start)
+                yielded.append(operation)
+                yield operation
+        parser.close()
+        metrics.observe("stream.complete", time.perf_counter() - start)
+    except MalformedResponseException:
+        metrics.increment("stream.malformed")
+        if yielded:
+            raise
+        fallback = True
+    except Exception as e:
+        if yielded:
+            raise
         if config.verbose:
-            print(
-                "[call_ollama_llava] user_prompt",
-                user_prompt,
-            )
-
-        vision_message = {
-            "role": "user",
-            "content": user_prompt,
-            "images": [screenshot_filename],
-        }
-        messages.append(vision_message)
-
-        response = model.chat(
-            model="llava",
-            messages=messages,
+            print("[stream_next_action] stream failed, retrying without streaming", e)
+        fallback = True
+    else:
+        fallback = False
+    finally:
+        await chunks.aclose()
+        provider.after_request(messages)
+        if yielded:
+            # Record what was acted on, even if the rest of the stream was unusable
+            messages.append({"role": "assistant", "content": json.dumps(yielded)})
+
+    if fallback:
+        del messages[message_count:]  # `get_next_action` sends the user message again
+        operations, _ = await get_next_action(
+            model, messages, objective, None, frame, hint
         )
+        for operation in operations:
+            yield operation
 
-        # Important: Remove the image path from the message history.
-        # Ollama will attempt to load each image reference and will
-        # eventually timeout.
-        messages[-1]["images"] = None
 
-        content = response["message"]["content"].strip()
-
-        content = clean_json(content)
-
-        assistant_message = {"role": "assistant", "content": content}
-        if config.verbose:
-            print(
-                "[call_ollama_llava] content",
-                content,
-            )
-        content = json.loads(content)
+async def ground_operation(provider, operation, frame, label_positions=None):
+    """
+    Ground stage: adds the `x` and `y` percentages to a click operation that names its
+    target instead of giving coordinates.
+    """
+    if operation.get("operation") != "click":
+        return
+    if provider.grounding == "ocr":
+        await resolve_text_click(operation, frame)
+    elif provider.grounding == "labels":
+        resolve_label_click(operation, label_positions)
 
-        messages.append(assistant_message)
 
-        return content
+async def resolve_text_click(operation, frame):
+    """
+    Adds the `x` and `y` percentages of the text a click operation names, using OCR.
+    """
+    text_to_click = operation.get("text")
+    if config.verbose:
+        print("[resolve_text_click] text_to_click", text_to_click)
+    # Read the screenshot, sharing the OCR pass with other clicks on this frame
+    result = await asyncio.to_thread(read_text, frame)
+    text_element_index = get_text_element(result, text_to_click, frame)
+    coordinates = get_text_coordinates(result, text_element_index, frame)
+    operation["x"] = coordinates["x"]
+    operation["y"] = coordinates["y"]
+    if config.verbose:
+        print("[resolve_text_click] final operation", operation)
 
-    except ollama.ResponseError as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Operate] Couldn't connect to Ollama. With Ollama installed, run `ollama pull llava` then `ollama serve`{ANSI_RESET}",
-            e,
-        )
 
-    except Exception as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[llava] That did not work. Trying again {ANSI_RESET}",
-            e,
-        )
+def resolve_label_click(operation, label_positions):
+    """
+    Adds the `x` and `y` percentages of the set-of-mark label a click operation names.
+    """
+    label = operation.get("label")
+    click_position_percent = get_label_position(label, label_positions)
+    if config.verbose:
+        print("[resolve_label_click] label", label)
+        print("[resolve_label_click] click_position_percent", click_position_percent)
+    if not click_position_percent:
         print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] AI response was {ANSI_RESET}",
-            content,
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] Failed to get click position in percent. Trying another method {ANSI_RESET}"
         )
-        if config.verbose:
-            traceback.print_exc()
-        return call_ollama_llava(messages)
-
-
-async def call_claude_3_with_ocr(messages, objective, model):
-    if config.verbose:
-        print("[call_claude_3_with_ocr]")
-
-    try:
-        time.sleep(1)
-        client = config.initialize_anthropic()
-
-        confirm_system_prompt(messages, objective, model)
-        screenshots_dir = "screenshots"
-        if not os.path.exists(screenshots_dir):
-            os.makedirs(screenshots_dir)
-
-        screenshot_filename = os.path.join(screenshots_dir, "screenshot.png")
-        capture_screen_with_cursor(screenshot_filename)
-
-        # downsize screenshot due to 5MB size limit
-        with open(screenshot_filename, "rb") as img_file:
-            img = Image.open(img_file)
-
-            # Convert RGBA to RGB
-            if img.mode == "RGBA":
-                img = img.convert("RGB")
-
-            # Calculate the new dimensions while maintaining the aspect ratio
-            original_width, original_height = img.size
-            aspect_ratio = original_width / original_height
-            new_width = 2560  # Adjust this value to achieve the desired file size
-            new_height = int(new_width / aspect_ratio)
-            if config.verbose:
-                print("[call_claude_3_with_ocr] resizing claude")
+        raise ValueError(f"No position for label {label}")
+    operation["x"] = f"{click_position_percent[0]:.2f}"
+    operation["y"] = f"{click_position_percent[1]:.2f}"
 
-            # Resize the image
-            img_resized = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-            # Save the resized and converted image to a BytesIO object for JPEG format
-            img_buffer = io.BytesIO()
-            img_resized.save(
-                img_buffer, format="JPEG", quality=85
-            )  # Adjust the quality parameter as needed
-            img_buffer.seek(0)
+async def preconnect_model(model):
+    """
+    Prepares the provider of `model` before its first request: providers on the
+    shared httpx pool open their connection, Ollama loads the model into memory.
+    Gemini goes through Google's own transport and isn't warmed up.
+    """
+    provider = PROVIDERS.get(model)
+    if provider:
+        await provider.preload()
 
-            # Encode the resized image as base64
-            img_data = base64.b64encode(img_buffer.getvalue()).decode("utf-8")
 
-        if len(messages) == 1:
-            user_prompt = get_user_first_message_prompt()
-        else:
-            user_prompt = get_user_prompt()
-
-        vision_message = {
-            "role": "user",
-            "content": [
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": img_data,
-                    },
-                },
-                {
-                    "type": "text",
-                    "text": user_prompt
-                    + "**REMEMBER** Only output json format, do not append any other text.",
-                },
-            ],
-        }
-        messages.append(vision_message)
-
-        # anthropic api expect system prompt as an separate argument
-        response = client.messages.create(
-            model="claude-3-opus-20240229",
-            max_tokens=3000,
-            system=messages[0]["content"],
-            messages=messages[1:],
-        )
-
-        content = response.content[0].text
-        content = clean_json(content)
-        content_str = content
-        try:
-            content = json.loads(content)
-        # rework for json mode output
-        except json.JSONDecodeError as e:
-            if config.verbose:
-                print(
-                    f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] JSONDecodeError: {e} {ANSI_RESET}"
-                )
-            response = client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=3000,
-                system=f"This json string is not valid, when using with json.loads(content) \
-                it throws the following error: {e}, return correct json string. \
-                **REMEMBER** Only output json format, do not append any other text.",
-                messages=[{"role": "user", "content": content}],
-            )
-            content = response.content[0].text
-            content = clean_json(content)
-            content_str = content
-            content = json.loads(content)
-
-        if config.verbose:
-            print(
-                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] content: {content} {ANSI_RESET}"
-            )
-        processed_content = []
-
-        for operation in content:
-            if operation.get("operation") == "click":
-                text_to_click = operation.get("text")
-                if config.verbose:
-                    print(
-                        "[call_claude_3_ocr][click] text_to_click",
-                        text_to_click,
-                    )
-                # Initialize EasyOCR Reader
-                reader = easyocr.Reader(["en"])
-
-                # Read the screenshot
-                result = reader.readtext(screenshot_filename)
-
-                # limit the text to extract has a higher success rate
-                text_element_index = get_text_element(
-                    result, text_to_click[:3], screenshot_filename
-                )
-                coordinates = get_text_coordinates(
-                    result, text_element_index, screenshot_filename
+def convert_messages_to_openai(messages):
+    """
+    Returns a copy of an Anthropic, Ollama or Gemini message history in the OpenAI
+    format, so a failed `claude-3` step can fall back to `gpt-4o` and a stuck step
+    can be escalated to an OpenAI model.
+    """
+    gpt4_messages = [messages[0]]  # Include the system message
+    for message in messages[1:]:
+        if message["role"] == "user":
+            content = message["content"]
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}] if content else []
+            # Update the image type format from "source" to "url"
+            updated_content = []
+            for item in content:
+                if isinstance(item, dict) and "type" in item:
+                    if item["type"] == "image":
+                        media_type = item["source"].get("media_type", "image/png")
+                        updated_content.append(
+                            {
+                                "type": "image_url",
+                                "image_url": {
+                                    "url": f"data:{media_type};base64,{item['source']['data']}"
+                                },
+                            }
+                        )
+                    else:
+                        updated_content.append(item)
+            # Ollama keeps the screenshot bytes next to the text
+            for image in message.get("images") or []:
+                data = base64.b64encode(image).decode("utf-8")
+                updated_content.append(
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:image/png;base64,{data}"},
+                    }
                 )
 
-                # add `coordinates`` to `content`
-                operation["x"] = coordinates["x"]
-                operation["y"] = coordinates["y"]
-
-                if config.verbose:
-                    print(
-                        "[call_claude_3_ocr][click] text_element_index",
-                        text_element_index,
-                    )
-                    print(
-                        "[call_claude_3_ocr][click] coordinates",
-                        coordinates,
-                    )
-                    print(
-                        "[call_claude_3_ocr][click] final operation",
-                        operation,
-                    )
-                processed_content.append(operation)
+            gpt4_messages.append({"role": "user", "content": updated_content})
+        elif message["role"] == "assistant":
+            gpt4_messages.append({"role": "assistant", "content": message["content"]})
+    return gpt4_messages
 
-            else:
-                processed_content.append(operation)
 
-        assistant_message = {"role": "assistant", "content": content_str}
-        messages.append(assistant_message)
-
-        return processed_content
-
-    except Exception as e:
-        print(
-            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_BRIGHT_MAGENTA}[{model}] That did not work. Trying another method {ANSI_RESET}"
-        )
-        if config.verbose:
-            print("[Self-Operating Computer][Operate] error", e)
-            traceback.print_exc()
-            print("message before convertion ", messages)
-
-        # Convert the messages to the GPT-4 format
-        gpt4_messages = [messages[0]]  # Include the system message
-        for message in messages[1:]:
-            if message["role"] == "user":
-                # Update the image type format from "source" to "url"
-                updated_content = []
-                for item in message["content"]:
-                    if isinstance(item, dict) and "type" in item:
-                        if item["type"] == "image":
-                            updated_content.append(
-                                {
-                                    "type": "image_url",
-                                    "image_url": {
-                                        "url": f"data:image/png;base64,{item['source']['data']}"
-                                    },
-                                }
-                            )
-                        else:
-                            updated_content.append(item)
-
-                gpt4_messages.append({"role": "user", "content": updated_content})
-            elif message["role"] == "assistant":
-                gpt4_messages.append(
-                    {"role": "assistant", "content": message["content"]}
-                )
-
-        return gpt_4_fallback(gpt4_messages, objective, model)
+def get_message_text(message):
+    """
+    Returns the text of a message, without its images.
+    """
+    content = message["content"]
+    if isinstance(content, str):
+        return content
+    return "\n".join(
+        item["text"]
+        for item in content
+        if isinstance(item, dict) and item.get("type") == "text"
+    )
 
 
 def get_last_assistant_message(messages):
@@ -1074,34 +542,18 @@ def get_last_assistant_message(messages):
     return None  # Return None if no assistant message is found
 
 
-def gpt_4_fallback(messages, objective, model):
-    if config.verbose:
-        print("[gpt_4_fallback]")
-    system_prompt = get_system_prompt("gpt-4o", objective)
-    new_system_message = {"role": "system", "content": system_prompt}
-    # remove and replace the first message in `messages` with `new_system_message`
-
-    messages[0] = new_system_message
-
-    if config.verbose:
-        print("[gpt_4_fallback][updated]")
-        print("[gpt_4_fallback][updated] len(messages)", len(messages))
-
-    return call_gpt_4o(messages)
-
-
 def confirm_system_prompt(messages, objective, model):
     """
-    On `Exception` we default to `call_gpt_4_vision_preview` so we have this function to reassign system prompt in case of a previous failure
+    A failed step may fall back to `gpt-4o` and its system prompt, so we have this function to reassign system prompt in case of a previous failure
     """
     if config.verbose:
         print("[confirm_system_prompt] model", model)
 
     system_prompt = get_system_prompt(model, objective)
-    new_system_message = {"role": "system", "content": system_prompt}
-    # remove and replace the first message in `messages` with `new_system_message`
-
-    messages[0] = new_system_message
+    # only replace the first message when it changed, so the prefix the provider
+    # cached stays byte for byte the same across steps
+    if messages[0].get("content") != system_prompt:
+        messages[0] = {"role": "system", "content": system_prompt}
 
     if config.verbose:
         print("[confirm_system_prompt]")
@@ -1113,27 +565,3 @@ def confirm_system_prompt(messages, objective, model):
                 print("[confirm_system_prompt][message] content", m["content"])
                 print("------------------[end message]------------------")
 
-
-def clean_json(content):
-    if config.verbose:
-        print("\n\n[clean_json] content before cleaning", content)
-    if content.startswith("```json"):
-        content = content[
-            len("```json") :
-        ].strip()  # Remove starting ```json and trim whitespace
-    elif content.startswith("```"):
-        content = content[
-            len("```") :
-        ].strip()  # Remove starting ``` and trim whitespace
-    if content.endswith("```"):
-        content = content[
-            : -len("```")
-        ].strip()  # Remove ending ``` and trim whitespace
-
-    # Normalize line breaks and remove any unwanted characters
-    content = "\n".join(line.strip() for line in content.splitlines())
-
-    if config.verbose:
-        print("\n\n[clean_json] content after cleaning", content)
-
-    return content
@@ -1,3 +1,4 @@
+import functools
 import platform
 from operate.config import Config
 
@@ -206,17 +207,33 @@ OPERATE_PROMPT = """
 Please take the next best action. The `pyautogui` library will be used to execute your decision. Your output will be used in a `json.loads` loads statement. Remember you only have the following 4 operations available: click, write, press, done
 Action:"""
 
+SCREEN_UNCHANGED_PROMPT = """
+Note: the screen did not change after your last {unchanged_steps} set(s) of actions, so they had no visible effect. Do not repeat them. Try a different approach, for example a different element, a keyboard shortcut or another application.
+"""
+
 
 def get_system_prompt(model, objective):
     """
     Format the vision prompt more efficiently and print the name of the prompt used
     """
+    # Optional verbose output
+    if config.verbose:
+        print("[get_system_prompt] model:", model)
+
+    return format_system_prompt(model, objective, platform.system())
+
 
-    if platform.system() == "Darwin":
+@functools.lru_cache(maxsize=32)
+def format_system_prompt(model, objective, system):
+    """
+    Formats the system prompt for a model, objective and OS once, so every step sends
+    the exact same string and providers can cache the prompt prefix.
+    """
+    if system == "Darwin":
         cmd_string = "\"command\""
         os_search_str = "[\"command\", \"space\"]"
         operating_system = "Mac"
-    elif platform.system() == "Windows":
+    elif system == "Windows":
         cmd_string = "\"ctrl\""
         os_search_str = "[\"win\"]"
         operating_system = "Windows"
@@ -249,19 +266,22 @@ def get_system_prompt(model, objective):
             operating_system=operating_system,
         )
 
-    # Optional verbose output
-    if config.verbose:
-        print("[get_system_prompt] model:", model)
     # print("[get_system_prompt] prompt:", prompt)
 
     return prompt
 
 
-def get_user_prompt():
+def get_user_prompt(hint=None):
     prompt = OPERATE_PROMPT
+    if hint:
+        prompt = hint + prompt
     return prompt
 
 
+def get_screen_unchanged_prompt(unchanged_steps):
+    return SCREEN_UNCHANGED_PROMPT.format(unchanged_steps=unchanged_steps)
+
+
 def get_user_first_message_prompt():
     prompt = OPERATE_FIRST_MESSAGE_PROMPT
     return prompt
@@ -0,0 +1,560 @@
+import asyncio
+import json
+
+import ollama
+
+from operate.config import Config
+from operate.exceptions import MalformedResponseException, ModelNotRecognizedException
+from operate.models.schema import SCHEMA_NAME, get_operations_schema
+from operate.utils.connections import preconnect
+from operate.utils.metrics import metrics
+from operate.utils.style import ANSI_GREEN, ANSI_RED, ANSI_RESET
+
+# Load configuration
+config = Config()
+
+# Appended to the user prompt of models that tend to wrap their JSON in prose
+JSON_ONLY_REMINDER = "**REMEMBER** Only output json format, do not append any other text."
+
+# Appended when a JSON mode forces the response to be a single object instead of the
+# list the system prompts ask for
+OPERATIONS_WRAPPER_REMINDER = (
+    '**REMEMBER** Answer with one JSON object that holds the list of operations: '
+    '{"operations": [...]}'
+)
+
+
+class Provider:
+    """
+    Request and response adapter for one model.
+
+    The step pipeline in `operate.models.apis` captures the screen, builds the prompt,
+    parses the response and grounds click operations the same way for every model.
+    A provider only turns a prompt and an image into a message in its API's format,
+    sends the message history and returns the response text.
+
+    Attributes:
+        name (str): Provider the model is served by, used for retries and circuit breaking.
+        model (str): Model name sent in the request.
+        grounding (str): How click targets are located: `ocr` (the model names the
+            text to click), `labels` (the model names a set-of-mark label) or None
+            (the model gives coordinates).
+        image_options (dict): Keyword arguments of `Frame.to_base64` for the screenshot.
+        prompt_suffix (str): Text appended to every user prompt.
+        structured_output (bool): Whether the request constrains the response to the
+            operation schema with the API's native structured output, unless
+            `config.structured_output` is off.
+        request_options (dict): Extra keyword arguments of the API request.
+        message_format (str): Format of the messages the provider builds, so a history
+            can be handed to another provider that reads the same format.
+        can_stream (bool): Whether the provider implements `stream(messages)`, which
+            yields the response text as it arrives.
+    """
+
+    name = None
+    message_format = None
+    can_stream = False
+
+    def __init__(
+        self,
+        model,
+        grounding=None,
+        image_options=None,
+        prompt_suffix="",
+        structured_output=False,
+        **request_options,
+    ):
+        self.model = model
+        self.grounding = grounding
+        self.image_options = image_options or {}
+        self.prompt_suffix = prompt_suffix
+        self.structured_output = structured_output
+        self.request_options = request_options
+
+    def uses_structured_output(self):
+        return self.structured_output and config.structured_output
+
+    def get_request_options(self):
+        """
+        Returns the extra keyword arguments of a request, including the structured
+        output settings.
+        """
+        return dict(self.request_options)
+
+    def get_client(self):
+        raise NotImplementedError
+
+    def encode_image(self, frame):
+        return frame.to_base64(**self.image_options)
+
+    def build_message(self, user_prompt, image, hint=None):
+        """
+        Returns the user message carrying the prompt and the encoded screenshot.
+        """
+        raise NotImplementedError
+
+    async def request(self, messages):
+        """
+        Sends the message history and returns the response text.
+        """
+        raise NotImplementedError
+
+    def after_request(self, messages):
+        """
+        Adjusts the message history once the request was sent.
+        """
+
+    def get_base_url(self):
+        """
+        Returns the endpoint to preconnect to, or None if the client doesn't use the
+        shared connection pool.
+        """
+        return None
+
+    async def preload(self):
+        """
+        Prepares the provider for its first request, by default by opening the
+        connection to its endpoint.
+        """
+        base_url = self.get_base_url()
+        if base_url:
+            await preconnect(base_url)
+
+
+class OpenAIProvider(Provider):
+    """
+    OpenAI chat completions, and any endpoint compatible with them.
+    """
+
+    name = "openai"
+    message_format = "openai"
+    can_stream = True
+
+    def get_client(self):
+        return config.initialize_openai()
+
+    def get_request_options(self):
+        options = super().get_request_options()
+        if self.uses_structured_output():
+            options["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": SCHEMA_NAME,
+                    "schema": get_operations_schema(self.grounding),
+                    "strict": True,
+                },
+            }
+        return options
+
+    def build_message(self, user_prompt, image, hint=None):
+        return {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": user_prompt + self.prompt_suffix},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": f"data:image/jpeg;base64,{image}"},
+                },
+            ],
+        }
+
+    async def request(self, messages):
+        response = await self.get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            **self.get_request_options(),
+        )
+        record_usage(response.usage)
+        message = response.choices[0].message
+        # A structured output request can be refused, which leaves no content
+        refusal = getattr(message, "refusal", None)
+        if refusal or message.content is None:
+            raise MalformedResponseException(
+                message.content or "", refusal or "Empty model response"
+            )
+        return message.content
+
+    async def stream(self, messages):
+        response = await self.get_client().chat.completions.create(
+            model=self.model,
+            messages=messages,
+            stream=True,
+            # ask for the token usage in the final chunk
+            extra_body={"stream_options": {"include_usage": True}},
+            **self.get_request_options(),
+        )
+        async for chunk in response:
+            if getattr(chunk, "usage", None):
+                record_usage(chunk.usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def get_base_url(self):
+        return str(self.get_client().base_url)
+
+
+class QwenProvider(OpenAIProvider):
+    """
+    Qwen through DashScope's OpenAI compatible endpoint.
+    """
+
+    name = "qwen"
+
+    def get_client(self):
+        return config.initialize_qwen()
+
+
+class LocalProvider(OpenAIProvider):
+    """
+    A local server with an OpenAI compatible API, such as llama.cpp's `llama-server`
+    or vLLM, at `config.local_base_url`.
+    """
+
+    name = "local"
+
+    def get_client(self):
+        return config.initialize_local()
+
+
+class AnthropicProvider(Provider):
+    name = "anthropic"
+    message_format = "anthropic"
+    can_stream = True
+
+    def get_client(self):
+        return config.initialize_anthropic()
+
+    def get_request_options(self):
+        options = super().get_request_options()
+        if self.uses_structured_output():
+            # Anthropic has no JSON mode, but forcing a tool call gives input that
+            # follows the tool's schema
+            options["tools"] = [
+                {
+                    "name": SCHEMA_NAME,
+                    "description": "Execute operations on the computer",
+                    "input_schema": get_operations_schema(self.grounding),
+                }
+            ]
+            options["tool_choice"] = {"type": "tool", "name": SCHEMA_NAME}
+        return options
+
+    def build_message(self, user_prompt, image, hint=None):
+        return {
+            "role": "user",
+            "content": [
+                {
+                    "type": "image",
+                    "source": {
+                        "type": "base64",
+                        "media_type": "image/jpeg",
+                        "data": image,
+                    },
+                },
+                {"type": "text", "text": user_prompt + self.prompt_suffix},
+            ],
+        }
+
+    async def request(self, messages):
+        # anthropic api expect system prompt as an separate argument
+        system, cached_messages = get_anthropic_cached_prompt(messages)
+        response = await self.get_client().messages.create(
+            model=self.model,
+            system=system,
+            messages=cached_messages,
+            **self.get_request_options(),
+        )
+        record_usage(response.usage)
+        for block in response.content:
+            if block.type == "tool_use":
+                return json.dumps(block.input)
+        return response.content[0].text
+
+    async def stream(self, messages):
+        system, cached_messages = get_anthropic_cached_prompt(messages)
+        response = await self.get_client().messages.create(
+            model=self.model,
+            system=system,
+            messages=cached_messages,
+            stream=True,
+            **self.get_request_options(),
+        )
+        async for event in response:
+            if event.type == "message_start":
+                record_usage(event.message.usage)
+            elif event.type == "content_block_delta":
+                if event.delta.type == "text_delta":
+                    yield event.delta.text
+                elif event.delta.type == "input_json_delta":
+                    yield event.delta.partial_json
+
+    def get_base_url(self):
+        return str(self.get_client().base_url)
+
+
+class GeminiProvider(Provider):
+    """
+    Gemini Pro Vision, which gets the system prompt and the screenshot in a single
+    request without the earlier messages.
+    """
+
+    name = "google"
+    message_format = "gemini"
+
+    def get_client(self):
+        return config.initialize_google()
+
+    def encode_image(self, frame):
+        return frame.image
+
+    def build_message(self, user_prompt, image, hint=None):
+        return {"role": "user", "content": hint or "", "image": image}
+
+    async def request(self, messages):
+        prompt = messages[0]["content"] + messages[-1]["content"]
+        # The REST transport has no async API, so keep the blocking call off the event loop
+        response = await asyncio.to_thread(
+            self.get_client().generate_content, [prompt, messages[-1]["image"]]
+        )
+        return response.text[1:]
+
+    def after_request(self, messages):
+        # The image object can't be sent to any other provider
+        messages[-1].pop("image", None)
+
+
+class OllamaProvider(Provider):
+    """
+    A vision model served by Ollama.
+
+    Every request sends `config.ollama_keep_alive`, so the model stays loaded
+    between steps instead of being unloaded after Ollama's default five minutes,
+    and `config.ollama_options` such as `num_ctx` and `num_thread`.
+    """
+
+    name = "ollama"
+    message_format = "ollama"
+
+    def get_client(self):
+        return config.initialize_ollama()
+
+    def get_request_options(self):
+        options = super().get_request_options()
+        options["keep_alive"] = config.ollama_keep_alive
+        if config.ollama_options:
+            options["options"] = config.ollama_options
+        if self.uses_structured_output():
+            options["format"] = "json"
+        return options
+
+    async def preload(self):
+        """
+        Loads the model into memory while the first screenshot is captured. An empty
+        prompt only loads the model; it is sent with the same options as the requests,
+        since a different `num_ctx` would load the model again.
+        """
+        try:
+            await self.get_client().generate(
+                model=self.model,
+                prompt="",
+                keep_alive=config.ollama_keep_alive,
+                options=config.ollama_options or None,
+            )
+        except Exception as e:
+            if config.verbose:
+                print("[OllamaProvider][preload] failed for", self.model, e)
+
+    def encode_image(self, frame):
+        return frame.encode(**self.image_options)
+
+    def build_message(self, user_prompt, image, hint=None):
+        prompt = user_prompt + self.prompt_suffix
+        if self.uses_structured_output():
+            # `format="json"` only allows an object, so the list has to be wrapped
+            prompt += "\n" + OPERATIONS_WRAPPER_REMINDER
+        return {
+            "role": "user",
+            "content": prompt,
+            "images": [image],
+        }
+
+    async def request(self, messages):
+        try:
+            response = await self.get_client().chat(
+                model=self.model,
+                messages=messages,
+                **self.get_request_options(),
+            )
+        except ollama.ResponseError as e:
+            print(
+                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Operate] Couldn't connect to Ollama. With Ollama installed, run `ollama pull {self.model}` then `ollama serve`{ANSI_RESET}",
+                e,
+            )
+            raise
+        return response["message"]["content"].strip()
+
+    def after_request(self, messages):
+        # Important: Remove the image from the message history.
+        # Ollama would otherwise re-send every previous screenshot
+        # and eventually timeout.
+        messages[-1]["images"] = None
+
+
+# Providers by the model names accepted on the command line
+PROVIDERS = {}
+
+
+def register_provider(model, provider):
+    PROVIDERS[model] = provider
+
+
+def get_provider(model):
+    provider = PROVIDERS.get(model)
+    if provider is None:
+        raise ModelNotRecognizedException(model)
+    return provider
+
+
+register_provider(
+    "gpt-4",
+    OpenAIProvider(
+        "gpt-4o", structured_output=True, presence_penalty=1, frequency_penalty=1
+    ),
+)
+register_provider(
+    "gpt-4-with-som",
+    OpenAIProvider(
+        "gpt-4o",
+        grounding="labels",
+        structured_output=True,
+        presence_penalty=1,
+        frequency_penalty=1,
+    ),
+)
+register_provider(
+    "gpt-4-with-ocr", OpenAIProvider("gpt-4o", grounding="ocr", structured_output=True)
+)
+register_provider(
+    "gpt-4.1-with-ocr",
+    OpenAIProvider("gpt-4.1", grounding="ocr", structured_output=True),
+)
+register_provider(
+    "o1-with-ocr", OpenAIProvider("o1", grounding="ocr", structured_output=True)
+)
+register_provider(
+    "qwen-vl",
+    QwenProvider(
+        "qwen2.5-vl-72b-instruct",
+        grounding="ocr",
+        # Compress screenshot image to make size be smaller
+        image_options={"format": "JPEG", "quality": 85},
+        prompt_suffix=JSON_ONLY_REMINDER,
+    ),
+)
+register_provider(
+    "claude-3",
+    AnthropicProvider(
+        "claude-3-opus-20240229",
+        grounding="ocr",
+        # downsize screenshot due to 5MB size limit
+        image_options={"format": "JPEG", "width": 2560, "quality": 85},
+        prompt_suffix=JSON_ONLY_REMINDER,
+        structured_output=True,
+        max_tokens=3000,
+    ),
+)
+register_provider("gemini-pro-vision", GeminiProvider("gemini-pro-vision"))
+register_provider("llava", OllamaProvider("llava", structured_output=True))
+register_provider(
+    "ollama", OllamaProvider(config.ollama_model, structured_output=True)
+)
+register_provider(
+    "local", LocalProvider(config.local_model, structured_output=True)
+)
+
+
+def get_anthropic_cached_prompt(messages):
+    """
+    Returns the `system` and `messages` arguments of an Anthropic request with prompt
+    caching breakpoints on the system prompt and on the latest message, so the next
+    step reads the whole conversation so far from the cache.
+
+    The breakpoints go on copies; the message history itself is left untouched.
+    """
+    system = [
+        {
+            "type": "text",
+            "text": messages[0]["content"],
+            "cache_control": {"type": "ephemeral"},
+        }
+    ]
+    cached_messages = messages[1:]
+    last = cached_messages[-1] if cached_messages else None
+    if last and isinstance(last["content"], list) and last["content"]:
+        content = list(last["content"])
+        content[-1] = {**content[-1], "cache_control": {"type": "ephemeral"}}
+        cached_messages = cached_messages[:-1] + [{**last, "content": content}]
+    return system, cached_messages
+
+
+def get_usage_value(usage, name):
+    """
+    Returns a token count of a usage object or, as some SDK versions return for
+    streamed responses, a usage dict. Missing counts are 0.
+    """
+    if usage is None:
+        return 0
+    if isinstance(usage, dict):
+        value = usage.get(name)
+    else:
+        value = getattr(usage, name, None)
+    return value or 0
+
+
+def record_usage(usage):
+    """
+    Records the token usage of a response, including the prompt tokens served from the
+    provider's prompt cache, as `tokens.*` metrics.
+
+    Handles the OpenAI (`prompt_tokens`) and Anthropic (`input_tokens`) usage, as
+    objects or dicts. Metrics never fail a request: errors are only printed in
+    verbose mode.
+    """
+    if not usage:
+        return
+    try:
+        if get_usage_value(usage, "input_tokens"):
+            cached_tokens = get_usage_value(usage, "cache_read_input_tokens")
+            # Anthropic counts cached and newly cached tokens separately from the rest
+            input_tokens = (
+                get_usage_value(usage, "input_tokens")
+                + cached_tokens
+                + get_usage_value(usage, "cache_creation_input_tokens")
+            )
+            output_tokens = get_usage_value(usage, "output_tokens")
+        else:
+            input_tokens = get_usage_value(usage, "prompt_tokens")
+            output_tokens = get_usage_value(usage, "completion_tokens")
+            if isinstance(usage, dict):
+                details = usage.get("prompt_tokens_details")
+            else:
+                details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = get_usage_value(details, "cached_tokens")
+    except Exception as e:
+        if config.verbose:
+            print("[record_usage] couldn't read usage", usage, e)
+        return
+
+    metrics.increment("tokens.input", input_tokens)
+    metrics.increment("tokens.cached", cached_tokens)
+    metrics.increment("tokens.output", output_tokens)
+    metrics.set_gauge("tokens.cached_last_step", cached_tokens)
+    if config.verbose:
+        print(
+            "[record_usage] input_tokens",
+            input_tokens,
+            "cached_tokens",
+            cached_tokens,
+            "output_tokens",
+            output_tokens,
+        )
@@ -0,0 +1,52 @@
+import functools
+
+# Name of the structured output schema and of the Anthropic tool carrying it
+SCHEMA_NAME = "operate"
+
+
+def _operation(operation, properties):
+    properties = {
+        "thought": {"type": "string"},
+        "operation": {"type": "string", "enum": [operation]},
+        **properties,
+    }
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_operations_schema(grounding=None):
+    """
+    Returns the JSON schema of a response: `{"operations": [...]}` with the four
+    operations of the system prompts. Structured output requires an object at the top,
+    so the list the prompts ask for is wrapped.
+
+    :param grounding: How the model names click targets: `ocr` (text), `labels`
+        (set-of-mark label) or None (x and y percentages).
+    """
+    if grounding == "ocr":
+        click = {"text": {"type": "string"}}
+    elif grounding == "labels":
+        click = {"label": {"type": "string"}}
+    else:
+        click = {"x": {"type": "string"}, "y": {"type": "string"}}
+    operation = {
+        "anyOf": [
+            _operation("click", click),
+            _operation("write", {"content": {"type": "string"}}),
+            _operation(
+                "press", {"keys": {"type": "array", "items": {"type": "string"}}}
+            ),
+            _operation("done", {"summary": {"type": "string"}}),
+        ]
+    }
+    return {
+        "type": "object",
+        "properties": {"operations": {"type": "array", "items": operation}},
+        "required": ["operations"],
+        "additionalProperties": False,
+    }
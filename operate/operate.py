@@ -1,15 +1,15 @@
 import sys
 import os
-import time
 import asyncio
 from prompt_toolkit.shortcuts import message_dialog
 from prompt_toolkit import prompt
-from operate.exceptions import ModelNotRecognizedException
+from operate.exceptions import MalformedResponseException, ModelNotRecognizedException
 import platform
 
 # from operate.models.prompts import USER_QUESTION, get_system_prompt
 from operate.models.prompts import (
     USER_QUESTION,
+    get_screen_unchanged_prompt,
     get_system_prompt,
 )
 from operate.config import Config
@@ -23,7 +23,23 @@ from operate.utils.style import (
     style,
 )
 from operate.utils.operating_system import OperatingSystem
-from operate.models.apis import get_next_action
+from operate.utils.frame import FrameHistory
+from operate.utils.history import apply_history_policy, report_payload
+from operate.utils.metrics import metrics
+from operate.utils.screenshot import capture_frame
+from operate.utils.settle import wait_for_screen_settle
+from operate.utils.artifacts import get_artifact_writer
+from operate.utils.label import prewarm_yolo_model
+from operate.utils.ocr import prewarm_ocr_reader
+from operate.models.apis import (
+    OCR_MODELS,
+    capture_step_frame,
+    convert_messages,
+    get_next_action,
+    preconnect_model,
+    record_converted_step,
+    stream_next_action,
+)
 
 # Load configuration
 config = Config()
@@ -48,6 +64,16 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
 
     config.verbose = verbose_mode
     config.validation(model, voice_mode)
+    if config.stuck_action == "escalate":
+        config.validation(config.stuck_escalation_model, voice_mode)
+    if config.hedge_model:
+        config.validation(config.hedge_model, voice_mode)
+
+    # Load the OCR and YOLO weights while the user is still typing the objective
+    if config.ocr_prewarm and model in OCR_MODELS:
+        prewarm_ocr_reader()
+    if config.yolo_prewarm and model == "gpt-4-with-som":
+        prewarm_yolo_model()
 
     if voice_mode:
         try:
@@ -100,19 +126,96 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
     system_message = {"role": "system", "content": system_prompt}
     messages = [system_message]
 
+    # One event loop for the whole session, so clients and pending work
+    # carry over between steps
+    asyncio.run(run_session(model, objective, messages))
+
+    artifact_writer = get_artifact_writer()
+    if artifact_writer.enabled("final"):
+        # Record the screen the session ended on
+        wait_for_screen_settle()
+        capture_frame()
+    artifact_writer.flush()
+
+    if config.verbose:
+        metrics.report()
+    if config.metrics_file:
+        metrics.write(config.metrics_file)
+
+
+async def run_session(model, objective, messages):
+    """
+    Runs the session's steps, with the provider connections opened in the background.
+    """
+    # Tasks running alongside the loop, referenced so they aren't garbage collected
+    background_tasks = set()
+    if config.http_preconnect:
+        # Open the provider connection while the first screenshot is captured
+        background_tasks.add(asyncio.create_task(preconnect_model(model)))
+        if config.hedge_model:
+            background_tasks.add(
+                asyncio.create_task(preconnect_model(config.hedge_model))
+            )
+
+    try:
+        await run_steps(model, objective, messages)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+
+
+async def run_steps(model, objective, messages):
+    """
+    Runs the capture, decide and operate loop until the objective is complete.
+    """
     loop_count = 0
 
     session_id = None
 
+    frame_history = FrameHistory()
+
     while True:
         if config.verbose:
             print("[Self Operating Computer] loop_count", loop_count)
         try:
-            operations, session_id = asyncio.run(
-                get_next_action(model, messages, objective, session_id)
-            )
+            # wait for the previous operations to take effect before looking at the screen
+            frame = await capture_step_frame()
+            step_model, hint = model, None
+            if frame is not None:
+                frame_history.push(frame)
+                step_model, hint = handle_unchanged_screen(frame_history, model)
+                if step_model is None:
+                    break
+
+            # Shrink the screenshots of older steps before they are sent again
+            await asyncio.to_thread(apply_history_policy, messages)
+
+            step_messages = messages
+            if step_model != model:
+                # The escalation model may read another message format
+                step_messages = convert_messages(messages, model, step_model)
+            message_count = len(step_messages)
 
-            stop = operate(operations, model)
+            try:
+                if config.stream:
+                    stop = await operate_stream(
+                        stream_next_action(
+                            step_model, step_messages, objective, frame, hint
+                        ),
+                        model,
+                    )
+                else:
+                    operations, session_id = await get_next_action(
+                        step_model, step_messages, objective, session_id, frame, hint
+                    )
+
+                    stop = await operate(operations, model)
+            finally:
+                if step_messages is not messages:
+                    record_converted_step(messages, step_messages[message_count:])
+
+            report_payload(messages)
             if stop:
                 break
 
@@ -131,57 +234,139 @@ def main(model, terminal_prompt, voice_mode=False, verbose_mode=False):
             break
 
 
-def operate(operations, model):
+def handle_unchanged_screen(frame_history, model):
+    """
+    Decides how to run the next step when the last actions had no visible effect,
+    so the loop doesn't keep paying for vision calls that return the same decision.
+
+    Returns:
+    A tuple of the model to use and an optional prompt hint, or `(None, None)` to stop.
+    """
+    unchanged_steps = frame_history.unchanged_steps
+    threshold = config.stuck_threshold
+    if config.verbose:
+        print(
+            "[Self Operating Computer][handle_unchanged_screen] unchanged_steps",
+            unchanged_steps,
+        )
+    if not threshold or unchanged_steps < threshold:
+        return model, None
+
+    print(
+        f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_YELLOW} The screen did not change after the last {unchanged_steps} step(s){ANSI_RESET}"
+    )
+    # Give the model one chance to recover before giving up
+    if config.stuck_action == "abort" or unchanged_steps >= 2 * threshold:
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] -> Stopping, the actions are having no effect {ANSI_RESET}"
+        )
+        return None, None
+
+    hint = get_screen_unchanged_prompt(unchanged_steps)
+    if config.stuck_action == "escalate":
+        return config.stuck_escalation_model, hint
+    return model, hint
+
+
+async def operate(operations, model):
     if config.verbose:
         print("[Self Operating Computer][operate]")
     for operation in operations:
-        if config.verbose:
-            print("[Self Operating Computer][operate] operation", operation)
-        # wait one second
-        time.sleep(1)
-        operate_type = operation.get("operation").lower()
-        operate_thought = operation.get("thought")
-        operate_detail = ""
-        if config.verbose:
-            print("[Self Operating Computer][operate] operate_type", operate_type)
-
-        if operate_type == "press" or operate_type == "hotkey":
-            keys = operation.get("keys")
-            operate_detail = keys
-            operating_system.press(keys)
-        elif operate_type == "write":
-            content = operation.get("content")
-            operate_detail = content
-            operating_system.write(content)
-        elif operate_type == "click":
-            x = operation.get("x")
-            y = operation.get("y")
-            click_detail = {"x": x, "y": y}
-            operate_detail = click_detail
-
-            operating_system.mouse(click_detail)
-        elif operate_type == "done":
-            summary = operation.get("summary")
-
-            print(
-                f"[{ANSI_GREEN}Self-Operating Computer {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
-            )
-            print(f"{ANSI_BLUE}Objective Complete: {ANSI_RESET}{summary}\n")
+        with metrics.timer("stage.execute"):
+            stop = await execute_operation(operation, model)
+        if stop:
             return True
+    return False
 
-        else:
-            print(
-                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] unknown operation response :({ANSI_RESET}"
-            )
-            print(
-                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] AI response {ANSI_RESET}{operation}"
-            )
-            return True
+
+async def operate_stream(operations, model):
+    """
+    Executes operations from an async iterator, each one as soon as it arrives.
+
+    If the response turns out to be malformed part way through, the operations that
+    were already executed stand, the rest is skipped and the next step looks at the
+    screen again.
+
+    Returns:
+    True if the objective is complete or the loop should stop.
+    """
+    if config.verbose:
+        print("[Self Operating Computer][operate_stream]")
+    try:
+        async for operation in operations:
+            with metrics.timer("stage.execute"):
+                stop = await execute_operation(operation, model)
+            if stop:
+                return True
+    except ModelNotRecognizedException:
+        raise
+    except MalformedResponseException as e:
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] Stopped executing a malformed response -> {e} {ANSI_RESET}"
+        )
+    except Exception as e:
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] Stopped executing, the response failed -> {e} {ANSI_RESET}"
+        )
+    finally:
+        await operations.aclose()
+    return False
+
+
+async def execute_operation(operation, model):
+    """
+    Executes a single operation.
+
+    Returns:
+    True if the objective is complete or the operation was not recognized.
+    """
+    if config.verbose:
+        print("[Self Operating Computer][operate] operation", operation)
+    # wait for the screen to settle after the previous operation
+    await asyncio.to_thread(wait_for_screen_settle)
+    operate_type = operation.get("operation").lower()
+    operate_thought = operation.get("thought")
+    operate_detail = ""
+    if config.verbose:
+        print("[Self Operating Computer][operate] operate_type", operate_type)
+
+    if operate_type == "press" or operate_type == "hotkey":
+        keys = operation.get("keys")
+        operate_detail = keys
+        await asyncio.to_thread(operating_system.press, keys)
+    elif operate_type == "write":
+        content = operation.get("content")
+        operate_detail = content
+        await asyncio.to_thread(operating_system.write, content)
+    elif operate_type == "click":
+        x = operation.get("x")
+        y = operation.get("y")
+        click_detail = {"x": x, "y": y}
+        operate_detail = click_detail
+
+        await asyncio.to_thread(operating_system.mouse, click_detail)
+    elif operate_type == "done":
+        summary = operation.get("summary")
 
         print(
             f"[{ANSI_GREEN}Self-Operating Computer {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
         )
-        print(f"{operate_thought}")
-        print(f"{ANSI_BLUE}Action: {ANSI_RESET}{operate_type} {operate_detail}\n")
+        print(f"{ANSI_BLUE}Objective Complete: {ANSI_RESET}{summary}\n")
+        return True
+
+    else:
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] unknown operation response :({ANSI_RESET}"
+        )
+        print(
+            f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] AI response {ANSI_RESET}{operation}"
+        )
+        return True
+
+    print(
+        f"[{ANSI_GREEN}Self-Operating Computer {ANSI_RESET}|{ANSI_BRIGHT_MAGENTA} {model}{ANSI_RESET}]"
+    )
+    print(f"{operate_thought}")
+    print(f"{ANSI_BLUE}Action: {ANSI_RESET}{operate_type} {operate_detail}\n")
 
     return False
@@ -0,0 +1,142 @@
+import atexit
+import os
+import queue
+import threading
+
+from operate.config import Config
+from operate.utils.frame import Frame
+from operate.utils.metrics import metrics
+
+# Load configuration
+config = Config()
+
+# Artifact levels, each one includes the ones before it
+LEVELS = ["none", "final", "step", "debug"]
+
+# Keyword argument of `Image.save` that `config.artifact_compression` maps to
+COMPRESSION_PARAMS = {"PNG": "compress_level", "JPEG": "quality", "WEBP": "quality"}
+
+
+class ArtifactWriter:
+    """
+    Writes screenshots and debug images to disk on a background thread.
+
+    Images are queued as they are and only encoded by the writer thread, so
+    the step that produced them doesn't wait for the disk. The queue is
+    bounded: when it is full, new artifacts are dropped and counted in the
+    `artifacts.dropped` metric instead of slowing the step down.
+
+    Levels:
+        none: Nothing is written.
+        final: Only the last screenshot, written when the session ends.
+        step: The screenshot and labeled image of every step.
+        debug: Also the YOLO debug and OCR bounding box images.
+    """
+
+    def __init__(self, level="none", format="PNG", compression=None, max_pending=16):
+        if level not in LEVELS:
+            raise ValueError(f"Unknown artifact level: {level}")
+        self.level = level
+        self.format = format.upper()
+        self.extension = "jpg" if self.format == "JPEG" else self.format.lower()
+        self.params = {}
+        if compression is not None and self.format in COMPRESSION_PARAMS:
+            self.params[COMPRESSION_PARAMS[self.format]] = compression
+        self._final = {}
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enabled(self, level):
+        """
+        Returns True if artifacts of the given level are written.
+        """
+        return self.level != "none" and LEVELS.index(level) <= LEVELS.index(self.level)
+
+    def save(self, level, directory, name, image):
+        """
+        Queues an image to be written as `<directory>/<name>.<extension>`.
+
+        :param level: Level of the artifact, one of `final`, `step` or `debug`.
+        :param directory: Directory to write to, created if needed.
+        :param name: File name without extension.
+        :param image: A `PIL.Image.Image` or a `Frame`. It must not be modified afterwards.
+        :return: The path the image will be written to, or None if it is skipped.
+        """
+        if not self.enabled(level):
+            return None
+        file_path = os.path.join(directory, f"{name}.{self.extension}")
+        if level == "final" and self.level == "final":
+            # Only the last one matters, keep it until the session ends
+            self._final[file_path] = image
+            return file_path
+
+        self._start()
+        try:
+            self._queue.put_nowait((file_path, image))
+        except queue.Full:
+            metrics.increment("artifacts.dropped")
+            return None
+        return file_path
+
+    def flush(self):
+        """
+        Blocks until all queued artifacts and the final screenshots are written.
+        """
+        final, self._final = self._final, {}
+        for file_path, image in final.items():
+            self._write(file_path, image)
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="artifact-writer", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            file_path, image = self._queue.get()
+            try:
+                self._write(file_path, image)
+            except Exception as e:
+                if config.verbose:
+                    print("[ArtifactWriter] failed to write", file_path, e)
+            finally:
+                self._queue.task_done()
+
+    def _write(self, file_path, image):
+        with metrics.timer("artifacts.write"):
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+            if isinstance(image, Frame):
+                # The frame may already hold this encoding
+                with open(file_path, "wb") as file:
+                    file.write(image.encode(self.format, **self.params))
+            else:
+                image.save(file_path, format=self.format, **self.params)
+        metrics.increment("artifacts.written")
+
+
+_artifact_writer = None
+_artifact_writer_lock = threading.Lock()
+
+
+def get_artifact_writer():
+    """
+    Returns the process-wide artifact writer.
+
+    The level defaults to `debug` in verbose mode and to `none` otherwise, so it is
+    resolved on first use, after the command line flags were applied to the config.
+    """
+    global _artifact_writer
+    with _artifact_writer_lock:
+        if _artifact_writer is None:
+            level = config.artifact_level or ("debug" if config.verbose else "none")
+            _artifact_writer = ArtifactWriter(
+                level, config.artifact_format, config.artifact_compression
+            )
+            atexit.register(_artifact_writer.flush)
+    return _artifact_writer
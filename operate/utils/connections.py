@@ -0,0 +1,103 @@
+import time
+
+import httpx
+
+from operate.config import Config
+from operate.utils.metrics import metrics
+from operate.utils.response_cache import get_transport
+
+# Load configuration
+config = Config()
+
+# Shared HTTP clients keyed by origin, so every provider client for the same
+# endpoint draws from one keep-alive pool
+_http_clients = {}
+
+
+class ConnectionTrace:
+    """
+    httpcore trace callback that notes whether a request had to open a new connection.
+
+    Requests on a kept-alive connection never emit the `connection.*` events. For TLS
+    endpoints the time spent in the TCP and TLS handshakes is recorded as `http.connect`.
+    """
+
+    def __init__(self):
+        self.connected = False
+        self._connect_start = None
+
+    async def __call__(self, event_name, info):
+        if event_name == "connection.connect_tcp.started":
+            self.connected = True
+            self._connect_start = time.perf_counter()
+        elif event_name == "connection.start_tls.complete":
+            metrics.observe("http.connect", time.perf_counter() - self._connect_start)
+
+
+async def _add_trace(request):
+    request.extensions["trace"] = ConnectionTrace()
+
+
+async def _record_connection(response):
+    if response.extensions.get("from_cache"):
+        return
+    trace = response.request.extensions.get("trace")
+    if isinstance(trace, ConnectionTrace):
+        metrics.increment(
+            "http.connection.new" if trace.connected else "http.connection.reused"
+        )
+
+
+def get_http_client_options():
+    """
+    Returns the keyword arguments for an `httpx.AsyncClient` with the configured pool
+    limits, response cache and connection reuse metrics, for clients that build their own.
+    """
+    limits = httpx.Limits(
+        max_connections=config.http_max_connections,
+        max_keepalive_connections=config.http_max_keepalive,
+        keepalive_expiry=config.http_keepalive_expiry,
+    )
+    return {
+        "transport": get_transport(limits),
+        "timeout": httpx.Timeout(config.http_timeout, connect=10.0),
+        "event_hooks": {"request": [_add_trace], "response": [_record_connection]},
+    }
+
+
+def get_http_client(base_url):
+    """
+    Returns the process-wide `httpx.AsyncClient` for an API base URL.
+
+    :param base_url: The provider endpoint, e.g. "https://api.openai.com/v1".
+    :return: The client shared by all base URLs with the same scheme, host and port.
+    """
+    url = httpx.URL(base_url)
+    key = (url.scheme, url.host, url.port)
+    client = _http_clients.get(key)
+    if client is None:
+        client = httpx.AsyncClient(**get_http_client_options())
+        _http_clients[key] = client
+    return client
+
+
+async def preconnect(base_url):
+    """
+    Opens a connection to `base_url` ahead of the first request, so the TCP and TLS
+    handshakes overlap with the first screen capture instead of delaying the model call.
+
+    Any response, including an error status, leaves a warm connection in the pool.
+    """
+    start = time.perf_counter()
+    try:
+        await get_http_client(base_url).head(base_url)
+    except httpx.HTTPError as e:
+        if config.verbose:
+            print("[preconnect] failed for", base_url, e)
+        return
+    if config.verbose:
+        print(
+            "[preconnect]",
+            base_url,
+            f"in {time.perf_counter() - start:.3f}s",
+        )
@@ -0,0 +1,225 @@
+import base64
+import collections
+import hashlib
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+
+class Frame:
+    """
+    A single captured screen image held in memory.
+
+    The frame is passed through capture, encoding, OCR/YOLO and coordinate
+    mapping so none of those steps have to touch the filesystem. Encodings
+    and the content hash are computed lazily and cached on the frame.
+
+    Attributes:
+        image (PIL.Image.Image): The RGB pixel buffer.
+        width (int): Width of the frame in pixels.
+        height (int): Height of the frame in pixels.
+        timestamp (float): Capture time as returned by `time.time()`.
+    """
+
+    # Tile grid and sampling strides used by `block_sums`
+    HASH_GRID = (16, 16)
+    HASH_ROW_STEP = 4
+    HASH_COLUMN_STEP = 2
+
+    def __init__(self, image, timestamp=None):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        self._image = image
+        self.width, self.height = image.size
+        self._init_caches(timestamp)
+
+    def _init_caches(self, timestamp):
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._raw = None
+        self._content_hash = None
+        self._block_sums = None
+        self._block_max = None
+        self._array = None
+        self._encodings = {}
+
+    @classmethod
+    def from_bgra(cls, raw, size, timestamp=None):
+        """
+        Build a frame from a raw BGRA/BGRX buffer such as the one returned by `mss`.
+
+        The RGB image is only converted on first use, so frames that are only
+        compared, e.g. while waiting for the screen to settle, never pay for it.
+        """
+        frame = cls.__new__(cls)
+        frame._image = None
+        frame.width, frame.height = size
+        frame._init_caches(timestamp)
+        frame._raw = raw
+        return frame
+
+    @property
+    def image(self):
+        """
+        The RGB pixel buffer as a `PIL.Image.Image`.
+        """
+        if self._image is None:
+            self._image = Image.frombuffer(
+                "RGB", self.size, self._raw, "raw", "BGRX", 0, 1
+            )
+        return self._image
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def content_hash(self):
+        """
+        Hex digest of the raw pixel data, used as a cache key for anything derived from the frame.
+        """
+        if self._content_hash is None:
+            self._content_hash = hashlib.blake2b(
+                self.image.tobytes(), digest_size=16
+            ).hexdigest()
+        return self._content_hash
+
+    @property
+    def block_sums(self):
+        """
+        Per-tile pixel sums over a `HASH_GRID` of tiles, sampling every `HASH_ROW_STEP`-th
+        row, and every `HASH_COLUMN_STEP`-th column of frames that weren't captured as BGRA.
+
+        This is the cheap fingerprint used to compare consecutive frames. Frames from
+        `mss` are summed straight from the BGRA capture buffer; other frames are
+        sampled by Pillow first, so neither path copies the whole image.
+        """
+        if self._block_sums is None:
+            if self._raw is not None:
+                pixels = np.frombuffer(self._raw, dtype=np.uint8).reshape(
+                    self.height, self.width, 4
+                )
+                # Every column: striding them would make numpy copy the sample
+                sample = pixels[:: self.HASH_ROW_STEP]
+            else:
+                sample = np.asarray(
+                    self.image.resize(
+                        (
+                            max(1, self.width // self.HASH_COLUMN_STEP),
+                            max(1, self.height // self.HASH_ROW_STEP),
+                        ),
+                        Image.Resampling.NEAREST,
+                    )
+                )
+            grid_width, grid_height = self.HASH_GRID
+            tile_height = sample.shape[0] // grid_height
+            tile_width = sample.shape[1] // grid_width
+            sample = sample[: tile_height * grid_height, : tile_width * grid_width]
+            self._block_sums = sample.reshape(
+                grid_height, tile_height, grid_width, tile_width * sample.shape[2]
+            ).sum(axis=(1, 3), dtype=np.uint32)
+            self._block_max = tile_height * tile_width * sample.shape[2] * 255
+        return self._block_sums
+
+    @property
+    def block_max(self):
+        """
+        Largest possible value of a tile in `block_sums`, to compare sums relatively.
+        """
+        self.block_sums
+        return self._block_max
+
+    def to_array(self):
+        """
+        Returns the pixels as a read-only `numpy` array of shape (height, width, 3) in RGB order.
+        """
+        if self._array is None:
+            self._array = np.asarray(self.image)
+        return self._array
+
+    def encode(self, format="PNG", width=None, **params):
+        """
+        Encodes the frame and caches the resulting bytes.
+
+        :param format: Any image format supported by Pillow (e.g. "PNG", "JPEG").
+        :param width: Optional target width; the height keeps the aspect ratio.
+        :param params: Extra keyword arguments for `Image.save` (e.g. `quality=85`).
+        :return: The encoded image bytes.
+        """
+        key = (format.upper(), width, tuple(sorted(params.items())))
+        if key not in self._encodings:
+            image = self.image
+            if width and width != self.width:
+                height = int(width / (self.width / self.height))
+                image = image.resize((width, height), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, format=format, **params)
+            self._encodings[key] = buffer.getvalue()
+        return self._encodings[key]
+
+    def to_base64(self, format="PNG", width=None, **params):
+        return base64.b64encode(self.encode(format, width, **params)).decode("utf-8")
+
+    def save(self, file_path):
+        """
+        Writes the frame to disk. Reuses a cached encoding when one exists for the file's format.
+        """
+        extension = file_path.rsplit(".", 1)[-1].upper()
+        format = "JPEG" if extension == "JPG" else extension
+        for (cached_format, width, _), data in self._encodings.items():
+            if cached_format == format and width is None:
+                with open(file_path, "wb") as file:
+                    file.write(data)
+                return
+        self.image.save(file_path)
+
+
+class FrameHistory:
+    """
+    Keeps the block sums of the most recent frames to detect a screen that stopped changing between steps.
+
+    Two frames count as unchanged when no tile differs by more than `TILE_TOLERANCE`,
+    so a blinking caret doesn't hide a loop that is stuck, while a typed word or a
+    toggled checkbox, which change only a tile or two, still count as a change.
+    """
+
+    # Fraction of a tile's largest sum that a tile may change by without counting
+    TILE_TOLERANCE = 0.005
+
+    def __init__(self, size=10):
+        self._fingerprints = collections.deque(maxlen=size)
+
+    def push(self, frame):
+        self._fingerprints.append((frame.block_sums, frame.block_max))
+
+    def count_changed_tiles(self, previous, current):
+        """
+        Returns the number of tiles that differ between two fingerprints by more than
+        `TILE_TOLERANCE`. Frames of different sizes differ in every tile.
+        """
+        (previous_sums, block_max), (current_sums, current_max) = previous, current
+        if previous_sums.shape != current_sums.shape or block_max != current_max:
+            return current_sums.size
+        difference = np.abs(
+            current_sums.astype(np.int64) - previous_sums.astype(np.int64)
+        )
+        return int(np.count_nonzero(difference > self.TILE_TOLERANCE * block_max))
+
+    @property
+    def unchanged_steps(self):
+        """
+        Number of consecutive steps, ending with the latest frame, after which the screen looked the same.
+        """
+        count = 0
+        fingerprints = list(self._fingerprints)
+        for previous, current in zip(
+            reversed(fingerprints[:-1]), reversed(fingerprints)
+        ):
+            if self.count_changed_tiles(previous, current):
+                break
+            count += 1
+        return count
+
+    def clear(self):
+        self._fingerprints.clear()
@@ -0,0 +1,190 @@
+import base64
+import io
+import json
+import math
+
+from PIL import Image
+
+from operate.config import Config
+from operate.utils.metrics import metrics
+
+# Load configuration
+config = Config()
+
+# Rough number of characters per token for English text and JSON
+CHARS_PER_TOKEN = 4
+
+
+def get_image_parts(message):
+    """
+    Returns the image parts of a message in either the OpenAI (`image_url`) or the
+    Anthropic (`image`) format.
+    """
+    content = message.get("content")
+    if not isinstance(content, list):
+        return []
+    return [
+        part
+        for part in content
+        if isinstance(part, dict) and part.get("type") in ("image_url", "image")
+    ]
+
+
+def get_image_data(part):
+    """
+    Returns the base64 data of an image part.
+    """
+    if part["type"] == "image":
+        return part["source"]["data"]
+    return part["image_url"]["url"].split("base64,", 1)[-1]
+
+
+def set_image_data(part, data, media_type):
+    if part["type"] == "image":
+        part["source"]["data"] = data
+        part["source"]["media_type"] = media_type
+    else:
+        part["image_url"]["url"] = f"data:{media_type};base64,{data}"
+
+
+def thumbnail_image_part(part, width):
+    """
+    Downscales the image of a part to `width` pixels in place, unless it is already that small.
+    """
+    image = Image.open(io.BytesIO(base64.b64decode(get_image_data(part))))
+    if image.width <= width:
+        return
+    height = max(1, int(image.height * width / image.width))
+    image = image.convert("RGB").resize((width, height), Image.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=70)
+    set_image_data(
+        part, base64.b64encode(buffer.getvalue()).decode("utf-8"), "image/jpeg"
+    )
+
+
+def summarize_operations(content):
+    """
+    Describes the operations of an assistant message in one line, e.g.
+    `press ["cmd", "space"]; write "Chrome"`.
+    """
+    try:
+        operations = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if isinstance(operations, dict):
+        operations = [operations]
+    actions = []
+    for operation in operations:
+        if not isinstance(operation, dict):
+            continue
+        operate_type = operation.get("operation")
+        if operate_type == "click":
+            target = operation.get("text") or operation.get("label")
+            if target:
+                actions.append(f"click {json.dumps(target)}")
+            else:
+                actions.append(f"click ({operation.get('x')}, {operation.get('y')})")
+        elif operate_type == "write":
+            actions.append(f"write {json.dumps(operation.get('content'))}")
+        elif operate_type in ("press", "hotkey"):
+            actions.append(f"press {json.dumps(operation.get('keys'))}")
+        elif operate_type:
+            actions.append(operate_type)
+    return "; ".join(actions) or None
+
+
+def apply_history_policy(messages):
+    """
+    Shrinks the screenshots of older steps so the payload doesn't grow with every step.
+
+    The latest `config.history_full_images` screenshots stay at full resolution. Older
+    ones are handled according to `config.history_old_images`:
+
+    - `thumbnail`: downscaled to `config.history_thumbnail_width` pixels.
+    - `drop`: removed.
+    - `summary`: replaced by a line describing the actions taken after that screenshot.
+    - `keep`: left untouched.
+
+    The list is modified in place.
+    """
+    policy = config.history_old_images
+    if policy == "keep":
+        return
+    indexes = [index for index, message in enumerate(messages) if get_image_parts(message)]
+    old = indexes[: max(len(indexes) - config.history_full_images, 0)]
+
+    for index in old:
+        message = messages[index]
+        parts = get_image_parts(message)
+        if policy == "thumbnail":
+            for part in parts:
+                thumbnail_image_part(part, config.history_thumbnail_width)
+            continue
+
+        content = [
+            part
+            for part in message["content"]
+            if not (isinstance(part, dict) and part.get("type") in ("image_url", "image"))
+        ]
+        if policy == "summary":
+            summary = None
+            if index + 1 < len(messages) and messages[index + 1]["role"] == "assistant":
+                summary = summarize_operations(messages[index + 1]["content"])
+            text = "(Screenshot removed from the history"
+            text += f". Actions taken on it: {summary})" if summary else ")"
+            content.append({"type": "text", "text": text})
+        message["content"] = content
+        metrics.increment("history.images_removed", len(parts))
+
+
+def estimate_image_tokens(part):
+    """
+    Estimates the tokens of an image with OpenAI's tile formula: 85 tokens plus 170 per
+    512px tile after the image is fit into 2048x2048 and its short side into 768.
+    """
+    image = Image.open(io.BytesIO(base64.b64decode(get_image_data(part))))
+    width, height = image.size
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def report_payload(messages):
+    """
+    Measures the request payload of `messages` and records it as the `history.*` gauges.
+
+    Returns:
+        tuple: The payload size in bytes, the estimated number of tokens and the number of images.
+    """
+    payload_bytes = 0
+    tokens = 0
+    images = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            payload_bytes += len(content)
+            tokens += len(content) // CHARS_PER_TOKEN
+            continue
+        for part in content or []:
+            if part.get("type") in ("image_url", "image"):
+                payload_bytes += len(get_image_data(part))
+                tokens += estimate_image_tokens(part)
+                images += 1
+            elif part.get("type") == "text":
+                payload_bytes += len(part["text"])
+                tokens += len(part["text"]) // CHARS_PER_TOKEN
+
+    metrics.set_gauge("history.payload_bytes", payload_bytes)
+    metrics.set_gauge("history.tokens_estimate", tokens)
+    metrics.set_gauge("history.images", images)
+    if config.verbose:
+        print(
+            "[report_payload]",
+            f"{len(messages)} messages, {images} images,",
+            f"{payload_bytes / 1024:.0f} KB, ~{tokens} tokens",
+        )
+    return payload_bytes, tokens, images
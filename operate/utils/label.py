@@ -2,9 +2,123 @@ import io
 import base64
 import json
 import os
+import shutil
+import threading
 import time
 import asyncio
-from PIL import Image, ImageDraw
+import math
+import pkg_resources
+from PIL import ImageDraw
+from ultralytics import YOLO
+
+from operate.config import Config
+from operate.utils.artifacts import get_artifact_writer
+
+# Load configuration
+config = Config()
+
+# YOLO detectors keyed by (runtime, int8), shared by the whole process
+_yolo_models = {}
+_yolo_models_lock = threading.Lock()
+
+
+def export_yolo_model(weights_path, runtime, int8=False, cache_dir=None):
+    """
+    Exports the YOLO weights to a CPU-friendly runtime, reusing a previous export.
+
+    :param weights_path: Path to the `best.pt` weights.
+    :param runtime: "onnx" (ONNX Runtime) or "openvino".
+    :param int8: Quantize to int8. ONNX uses dynamic quantization, OpenVINO uses
+        the ultralytics NNCF export, which needs its calibration dataset.
+    :param cache_dir: Directory the exports are kept in, defaults to `config.yolo_cache_dir`.
+    :return: Path of the exported model that `YOLO()` can load.
+    """
+    cache_dir = cache_dir or config.yolo_cache_dir
+    suffix = "_int8" if int8 else ""
+    if runtime == "onnx":
+        exported_path = os.path.join(cache_dir, f"best{suffix}.onnx")
+    elif runtime == "openvino":
+        exported_path = os.path.join(cache_dir, f"best{suffix}_openvino_model")
+    else:
+        raise ValueError(f"Unknown YOLO runtime: {runtime}")
+    if os.path.exists(exported_path):
+        return exported_path
+
+    if config.verbose:
+        print("[export_yolo_model] exporting", weights_path, "to", exported_path)
+    # ultralytics writes the export next to the weights, so export a copy in the cache.
+    # Everything is written under temporary names and only moved to `exported_path`
+    # once it is complete, so a failed export is never taken for a cached one.
+    os.makedirs(cache_dir, exist_ok=True)
+    local_weights = os.path.join(cache_dir, f"best{suffix}.export.pt")
+    temporary_paths = [local_weights]
+    try:
+        shutil.copyfile(weights_path, local_weights)
+        model = YOLO(local_weights)
+        if runtime == "onnx":
+            onnx_path = model.export(format="onnx")
+            temporary_paths.append(onnx_path)
+            if int8:
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+
+                quantized_path = os.path.join(cache_dir, f"best{suffix}.quantized.onnx")
+                temporary_paths.append(quantized_path)
+                quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QUInt8)
+                os.replace(quantized_path, exported_path)
+            else:
+                os.replace(onnx_path, exported_path)
+        else:
+            openvino_path = model.export(format="openvino", int8=int8)
+            temporary_paths.append(openvino_path)
+            os.replace(openvino_path, exported_path)
+    finally:
+        for path in temporary_paths:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+    return exported_path
+
+
+def get_yolo_model(runtime=None, int8=None):
+    """
+    Returns the process-wide YOLO detector for the set-of-mark path, loading it on first use.
+
+    :param runtime: "torch" (stock ultralytics), "onnx" or "openvino", defaults to `config.yolo_runtime`.
+    :param int8: Use an int8 quantized export, defaults to `config.yolo_int8`.
+    :return: The shared `YOLO` model.
+    """
+    runtime = runtime or config.yolo_runtime
+    int8 = config.yolo_int8 if int8 is None else int8
+    key = (runtime, int8 and runtime != "torch")
+
+    model = _yolo_models.get(key)
+    if model is None:
+        with _yolo_models_lock:
+            model = _yolo_models.get(key)
+            if model is None:
+                weights_path = pkg_resources.resource_filename(
+                    "operate.models.weights", "best.pt"
+                )
+                if runtime == "torch":
+                    model = YOLO(weights_path)
+                else:
+                    model = YOLO(
+                        export_yolo_model(weights_path, runtime, int8), task="detect"
+                    )
+                if config.verbose:
+                    print("[get_yolo_model] loaded", key)
+                _yolo_models[key] = model
+    return model
+
+
+def prewarm_yolo_model():
+    """
+    Loads the default detector on a background thread so the first step doesn't wait for it.
+    """
+    thread = threading.Thread(target=get_yolo_model, name="yolo-prewarm", daemon=True)
+    thread.start()
+    return thread
 
 
 def validate_and_extract_image_data(data):
@@ -26,15 +140,15 @@ def validate_and_extract_image_data(data):
     return image_data.split("base64,")[-1], messages
 
 
-def get_label_coordinates(label, label_coordinates):
+def get_label_position(label, label_positions):
     """
-    Retrieves the coordinates for a given label.
+    Retrieves the click position for a given label.
 
-    :param label: The label to find coordinates for (e.g., "~1").
-    :param label_coordinates: Dictionary containing labels and their coordinates.
-    :return: Coordinates of the label or None if the label is not found.
+    :param label: The label to find the position for (e.g., "~1").
+    :param label_positions: Dictionary containing labels and their click positions, as returned by `add_labels`.
+    :return: The click position in percent (x_percent, y_percent) or None if the label is not found.
     """
-    return label_coordinates.get(label)
+    return label_positions.get(label)
 
 
 def is_overlapping(box1, box2):
@@ -52,90 +166,151 @@ def is_overlapping(box1, box2):
     return True
 
 
-def add_labels(base64_data, yolo_model):
-    image_bytes = base64.b64decode(base64_data)
-    image_labeled = Image.open(io.BytesIO(image_bytes))  # Corrected this line
-    image_debug = image_labeled.copy()  # Create a copy for the debug image
-    image_original = (
-        image_labeled.copy()
-    )  # Copy of the original image for base64 return
+# Boxes spanning more grid cells than this are checked against every kept box instead
+MAX_GRID_CELLS = 64
 
-    results = yolo_model(image_labeled)
-
-    draw = ImageDraw.Draw(image_labeled)
-    debug_draw = ImageDraw.Draw(
-        image_debug
-    )  # Create a separate draw object for the debug image
-    font_size = 45
 
-    labeled_images_dir = "labeled_images"
-    label_coordinates = {}  # Dictionary to store coordinates
+def select_non_overlapping_boxes(boxes, cell_size=None):
+    """
+    Greedily keeps, in order, every box that doesn't overlap or touch a box kept before it.
 
-    if not os.path.exists(labeled_images_dir):
-        os.makedirs(labeled_images_dir)
+    Gives the same result as checking each box against all kept boxes with
+    `is_overlapping`, but kept boxes are indexed on a uniform grid so a box is
+    only compared with the kept boxes in the cells it covers.
 
-    counter = 0
-    drawn_boxes = []  # List to keep track of boxes already drawn
-    for result in results:
-        if hasattr(result, "boxes"):
-            for det in result.boxes:
-                bbox = det.xyxy[0]
-                x1, y1, x2, y2 = bbox.tolist()
-
-                debug_label = "D_" + str(counter)
-                debug_index_position = (x1, y1 - font_size)
-                debug_draw.rectangle([(x1, y1), (x2, y2)], outline="blue", width=1)
-                debug_draw.text(
-                    debug_index_position,
-                    debug_label,
-                    fill="blue",
-                    font_size=font_size,
-                )
+    :param boxes: Sequence of (x1, y1, x2, y2) boxes.
+    :param cell_size: Grid cell size in pixels, defaults to the median box size.
+    :return: Indices of the kept boxes, in ascending order.
+    """
+    boxes = [tuple(map(float, box)) for box in boxes]
+    if not boxes:
+        return []
+    if cell_size is None:
+        sizes = sorted(max(x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes)
+        cell_size = max(sizes[len(sizes) // 2], 1.0)
+
+    grid = {}
+    oversized = []  # Kept boxes too large for the grid
+    kept = []
+    for index, box in enumerate(boxes):
+        x1, y1, x2, y2 = box
+        cell_x1, cell_y1 = math.floor(x1 / cell_size), math.floor(y1 / cell_size)
+        cell_x2, cell_y2 = math.floor(x2 / cell_size), math.floor(y2 / cell_size)
+        cell_count = (cell_x2 - cell_x1 + 1) * (cell_y2 - cell_y1 + 1)
+
+        if cell_count > MAX_GRID_CELLS:
+            candidates = [boxes[i] for i in kept]
+        else:
+            candidates = list(oversized)
+            for cell_x in range(cell_x1, cell_x2 + 1):
+                for cell_y in range(cell_y1, cell_y2 + 1):
+                    candidates.extend(grid.get((cell_x, cell_y), ()))
+
+        if any(
+            not (x1 > other_x2 or other_x1 > x2 or y1 > other_y2 or other_y1 > y2)
+            for other_x1, other_y1, other_x2, other_y2 in candidates
+        ):
+            continue
+
+        kept.append(index)
+        if cell_count > MAX_GRID_CELLS:
+            oversized.append(box)
+        else:
+            for cell_x in range(cell_x1, cell_x2 + 1):
+                for cell_y in range(cell_y1, cell_y2 + 1):
+                    grid.setdefault((cell_x, cell_y), []).append(box)
+    return kept
+
+
+def add_labels(image, yolo_model):
+    """
+    Detects UI elements in a screenshot and draws a numbered label on each of them.
 
-                overlap = any(
-                    is_overlapping((x1, y1, x2, y2), box) for box in drawn_boxes
-                )
+    The screenshot is only decoded once, by the caller, and left untouched; the labels
+    are drawn on a copy. Click positions are computed while the labels are created, so
+    resolving a label later is a dict lookup.
 
-                if not overlap:
-                    draw.rectangle([(x1, y1), (x2, y2)], outline="red", width=1)
-                    label = "~" + str(counter)
-                    index_position = (x1, y1 - font_size)
-                    draw.text(
-                        index_position,
-                        label,
-                        fill="red",
-                        font_size=font_size,
-                    )
+    :param image: The screenshot as a `PIL.Image.Image`, e.g. `frame.image`.
+    :param yolo_model: The YOLO model used for detection.
+    :return: A tuple of the labeled image as base64 PNG and a dict mapping each
+        label (e.g. "~1") to its click position in percent (x_percent, y_percent).
+    """
+    image_labeled = image.copy()
 
-                    # Add the non-overlapping box to the drawn_boxes list
-                    drawn_boxes.append((x1, y1, x2, y2))
-                    label_coordinates[label] = (x1, y1, x2, y2)
+    artifact_writer = get_artifact_writer()
+    debug = artifact_writer.enabled("debug")
+    if debug:
+        image_debug = image.copy()  # Create a copy for the debug image
 
-                    counter += 1
+    results = yolo_model(image)
 
-    # Save the image
-    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    draw = ImageDraw.Draw(image_labeled)
+    if debug:
+        debug_draw = ImageDraw.Draw(
+            image_debug
+        )  # Create a separate draw object for the debug image
+    font_size = 45
 
-    output_path = os.path.join(labeled_images_dir, f"img_{timestamp}_labeled.png")
-    output_path_debug = os.path.join(labeled_images_dir, f"img_{timestamp}_debug.png")
-    output_path_original = os.path.join(
-        labeled_images_dir, f"img_{timestamp}_original.png"
-    )
+    label_positions = {}  # Click position of each label in percent
 
-    image_labeled.save(output_path)
-    image_debug.save(output_path_debug)
-    image_original.save(output_path_original)
+    detected_boxes = [
+        det.xyxy[0].tolist()
+        for result in results
+        if hasattr(result, "boxes")
+        for det in result.boxes
+    ]
+    kept = set(select_non_overlapping_boxes(detected_boxes))
 
-    buffered_original = io.BytesIO()
-    image_original.save(buffered_original, format="PNG")  # I guess this is needed
-    img_base64_original = base64.b64encode(buffered_original.getvalue()).decode("utf-8")
+    counter = 0
+    for index, (x1, y1, x2, y2) in enumerate(detected_boxes):
+        if debug:
+            debug_label = "D_" + str(counter)
+            debug_index_position = (x1, y1 - font_size)
+            debug_draw.rectangle([(x1, y1), (x2, y2)], outline="blue", width=1)
+            debug_draw.text(
+                debug_index_position,
+                debug_label,
+                fill="blue",
+                font_size=font_size,
+            )
+
+        if index in kept:
+            draw.rectangle([(x1, y1), (x2, y2)], outline="red", width=1)
+            label = "~" + str(counter)
+            index_position = (x1, y1 - font_size)
+            draw.text(
+                index_position,
+                label,
+                fill="red",
+                font_size=font_size,
+            )
+
+            label_positions[label] = get_click_position_in_percent(
+                (x1, y1, x2, y2), image.size
+            )
+
+            counter += 1
+
+    # Save the images in the background
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    labeled_images_dir = "labeled_images"
+    artifact_writer.save(
+        "step", labeled_images_dir, f"img_{timestamp}_labeled", image_labeled
+    )
+    if debug:
+        artifact_writer.save(
+            "debug", labeled_images_dir, f"img_{timestamp}_debug", image_debug
+        )
+        artifact_writer.save(
+            "debug", labeled_images_dir, f"img_{timestamp}_original", image
+        )
 
     # Convert image to base64 for return
     buffered_labeled = io.BytesIO()
     image_labeled.save(buffered_labeled, format="PNG")  # I guess this is needed
     img_base64_labeled = base64.b64encode(buffered_labeled.getvalue()).decode("utf-8")
 
-    return img_base64_labeled, label_coordinates
+    return img_base64_labeled, label_positions
 
 
 def get_click_position_in_percent(coordinates, image_size):
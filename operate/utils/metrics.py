@@ -0,0 +1,108 @@
+import collections
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """
+    Process-wide counters, gauges and timings.
+
+    Counters count events (e.g. cache hits), gauges hold the latest value of a
+    state (e.g. a circuit breaker) and timings keep the most recent samples of
+    a duration in seconds so percentiles can be derived from them.
+    """
+
+    def __init__(self, max_samples=1000):
+        self._lock = threading.Lock()
+        self._max_samples = max_samples
+        self.counters = collections.defaultdict(int)
+        self.gauges = {}
+        self.timings = collections.defaultdict(
+            lambda: collections.deque(maxlen=self._max_samples)
+        )
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self.timings[name].append(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def count(self, name):
+        """
+        Returns the number of samples kept for a timing.
+        """
+        with self._lock:
+            return len(self.timings.get(name, ()))
+
+    def percentile(self, name, percent):
+        """
+        Returns the given percentile (0-100) of a timing, or None without samples.
+        """
+        with self._lock:
+            samples = sorted(self.timings.get(name, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self):
+        with self._lock:
+            timings = {name: list(samples) for name, samples in self.timings.items()}
+            snapshot = {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+        snapshot["timings"] = {
+            name: {
+                "count": len(samples),
+                "mean": sum(samples) / len(samples),
+                "p50": self.percentile(name, 50),
+                "p95": self.percentile(name, 95),
+            }
+            for name, samples in timings.items()
+            if samples
+        }
+        return snapshot
+
+    def report(self):
+        """
+        Prints a summary of all metrics.
+        """
+        snapshot = self.snapshot()
+        print("[Metrics]")
+        for name, value in sorted(snapshot["counters"].items()):
+            print(f"[Metrics] {name}: {value}")
+        for name, value in sorted(snapshot["gauges"].items()):
+            print(f"[Metrics] {name}: {value}")
+        for name, timing in sorted(snapshot["timings"].items()):
+            print(
+                f"[Metrics] {name}: n={timing['count']} mean={timing['mean'] * 1000:.1f}ms "
+                f"p50={timing['p50'] * 1000:.1f}ms p95={timing['p95'] * 1000:.1f}ms"
+            )
+
+    def write(self, file_path):
+        """
+        Writes a snapshot of all metrics to `file_path` as JSON.
+        """
+        with open(file_path, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+# Shared by the whole process
+metrics = Metrics()
@@ -1,22 +1,517 @@
 from operate.config import Config
-from PIL import Image, ImageDraw
-import os
+from operate.utils.artifacts import get_artifact_writer
+from operate.utils.metrics import metrics
+from PIL import ImageDraw
+import collections
+import difflib
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 
+import easyocr
+import numpy as np
+
 # Load configuration
 config = Config()
 
+# EasyOCR readers keyed by (languages, gpu), shared by the whole process
+_readers = {}
+_readers_lock = threading.Lock()
+
+
+def get_ocr_reader(languages=None, gpu=None):
+    """
+    Returns the process-wide EasyOCR reader for a language set and device, loading it on first use.
+
+    Loading the detector and recognizer weights takes seconds, so this happens once per
+    process instead of once per click.
+    Args:
+        languages (list): Language codes, defaults to `config.ocr_languages`.
+        gpu (bool): Whether to run on the GPU, defaults to `config.ocr_gpu`.
+
+    Returns:
+        easyocr.Reader: The shared reader.
+    """
+    if languages is None:
+        languages = config.ocr_languages
+    if gpu is None:
+        gpu = config.ocr_gpu
+    key = (tuple(languages), gpu)
+
+    reader = _readers.get(key)
+    if reader is None:
+        with _readers_lock:
+            reader = _readers.get(key)
+            if reader is None:
+                if config.verbose:
+                    print("[get_ocr_reader] loading reader", key)
+                reader = easyocr.Reader(list(languages), gpu=gpu)
+                _readers[key] = reader
+    return reader
+
+
+def prewarm_ocr_reader():
+    """
+    Loads the default reader on a background thread so the first click doesn't wait for it.
+    """
+    thread = threading.Thread(target=get_ocr_reader, name="ocr-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+class OcrResultCache:
+    """
+    Bounded LRU of EasyOCR results keyed by frame content hash and language set.
+
+    Every click in a response, and every fallback handling the same frame,
+    shares one detection and recognition pass. Hits and misses are counted
+    as `ocr.cache.hit` and `ocr.cache.miss` metrics.
+    """
+
+    def __init__(self, max_size):
+        self._max_size = max_size
+        self._results = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+        metrics.increment("ocr.cache.hit" if result is not None else "ocr.cache.miss")
+        return result
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self._max_size:
+                self._results.popitem(last=False)
+
+
+_ocr_cache = OcrResultCache(config.ocr_cache_size)
+
+# The last frame read per language set and its results, the base for incremental OCR
+_last_read = {}
+_last_read_lock = threading.Lock()
+
+
+# OCR runs on one worker thread so it can overlap with the model request;
+# reads of the same frame that are already running are joined instead of repeated
+_ocr_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr")
+_pending_reads = {}
+_pending_reads_lock = threading.Lock()
+
+
+def read_text_async(frame, languages=None):
+    """
+    Starts reading a frame on the OCR worker thread, e.g. as soon as it is captured,
+    so that OCR overlaps with the model request.
+    Args:
+        frame (Frame): The frame to read.
+        languages (list): Language codes, defaults to `config.ocr_languages`.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the EasyOCR results, a list of (box, text, confidence).
+    """
+    if languages is None:
+        languages = config.ocr_languages
+    languages = tuple(languages)
+    key = (frame.content_hash, languages)
+
+    with _pending_reads_lock:
+        future = _pending_reads.get(key)
+        if future is not None:
+            metrics.increment("ocr.pending.joined")
+            return future
+
+        result = _ocr_cache.get(key)
+        if result is not None:
+            if config.verbose:
+                print(
+                    "[read_text] using cached OCR results for frame",
+                    frame.content_hash,
+                )
+            future = Future()
+            future.set_result(result)
+            return future
+
+        future = _ocr_executor.submit(_read_text_uncached, frame, languages, key)
+        _pending_reads[key] = future
+
+    def forget(_):
+        with _pending_reads_lock:
+            _pending_reads.pop(key, None)
+
+    future.add_done_callback(forget)
+    return future
+
+
+def read_text(frame, languages=None):
+    """
+    Runs EasyOCR on a frame, at most once per frame content and language set.
+
+    With `config.ocr_incremental` only the regions that changed since the previously
+    read frame are recognized again.
+    Args:
+        frame (Frame): The frame to read.
+        languages (list): Language codes, defaults to `config.ocr_languages`.
+
+    Returns:
+        list: The EasyOCR results, a list of (box, text, confidence).
+    """
+    future = read_text_async(frame, languages)
+    if not future.done():
+        with metrics.timer("ocr.wait"):
+            return future.result()
+    return future.result()
 
-def get_text_element(result, search_text, image_path):
+
+def _read_text_uncached(frame, languages, key):
+    reader = get_ocr_reader(languages)
+    with _last_read_lock:
+        previous = _last_read.get(languages)
+
+    with metrics.timer("ocr.readtext"):
+        if config.ocr_incremental and previous is not None:
+            result = read_text_incremental(reader, frame, *previous)
+        else:
+            result = reader.readtext(frame.to_array())
+            metrics.increment("ocr.full")
+
+    _ocr_cache.put(key, result)
+    with _last_read_lock:
+        _last_read[languages] = (frame, result)
+    return result
+
+
+def read_text_incremental(reader, frame, previous_frame, previous_result):
     """
-    Searches for a text element in the OCR results and returns its index. Also draws bounding boxes on the image.
+    Re-runs EasyOCR only on the tiles that changed since `previous_frame` and merges
+    the new text boxes with the unchanged ones from `previous_result`.
+
+    Previous boxes touching a dirty region are dropped and the region is grown to
+    cover them, so text crossing a region border is always recognized whole.
+    Args:
+        reader (easyocr.Reader): The reader to use.
+        frame (Frame): The frame to read.
+        previous_frame (Frame): The frame `previous_result` was read from.
+        previous_result (list): The EasyOCR results of `previous_frame`.
+
+    Returns:
+        list: The EasyOCR results for `frame`, a list of (box, text, confidence).
+    """
+    if previous_frame.size != frame.size:
+        metrics.increment("ocr.full")
+        return reader.readtext(frame.to_array())
+
+    regions = get_dirty_regions(
+        previous_frame.to_array(),
+        frame.to_array(),
+        config.ocr_tile_size,
+        config.ocr_tile_margin,
+    )
+    dirty_area = sum((x2 - x1) * (y2 - y1) for x1, y1, x2, y2 in regions)
+    if dirty_area > config.ocr_incremental_max_dirty * frame.width * frame.height:
+        metrics.increment("ocr.full")
+        return reader.readtext(frame.to_array())
+
+    pending = [(get_box_bounds(element[0]), element) for element in previous_result]
+    # Grow the regions until no previous box straddles their border
+    while True:
+        regions = merge_rectangles(regions)
+        grown = False
+        remaining = []
+        for bounds, element in pending:
+            index = next(
+                (
+                    i
+                    for i, region in enumerate(regions)
+                    if rectangles_intersect(bounds, region)
+                ),
+                None,
+            )
+            if index is None:
+                remaining.append((bounds, element))
+                continue
+            union = union_rectangles(regions[index], bounds)
+            if union != regions[index]:
+                regions[index] = union
+                grown = True
+        pending = remaining
+        if not grown:
+            break
+    kept = [element for _, element in pending]
+
+    image = frame.to_array()
+    for x1, y1, x2, y2 in regions:
+        x1, y1 = max(0, int(x1)), max(0, int(y1))
+        x2, y2 = min(frame.width, int(x2)), min(frame.height, int(y2))
+        for box, text, confidence in reader.readtext(image[y1:y2, x1:x2]):
+            box = [[point[0] + x1, point[1] + y1] for point in box]
+            kept.append((box, text, confidence))
+
+    metrics.increment("ocr.incremental")
+    metrics.increment("ocr.incremental.regions", len(regions))
+    if config.verbose:
+        print(
+            "[read_text_incremental] regions",
+            regions,
+            "dirty fraction",
+            round(dirty_area / (frame.width * frame.height), 3),
+        )
+
+    # Keep the reading order EasyOCR uses: top to bottom, then left to right
+    kept.sort(key=lambda element: get_box_bounds(element[0])[1::-1])
+    return kept
+
+
+def get_dirty_regions(previous, current, tile_size, margin):
+    """
+    Compares two images tile by tile and returns rectangles around connected groups of changed tiles.
+    Args:
+        previous (numpy.ndarray): The previous image, shape (height, width, channels).
+        current (numpy.ndarray): The current image, same shape as `previous`.
+        tile_size (int): Tile edge length in pixels.
+        margin (int): Pixels added around every rectangle.
+
+    Returns:
+        list: Rectangles as (x1, y1, x2, y2) tuples in pixels, clipped to the image.
+    """
+    height, width = current.shape[:2]
+    changed = np.any(previous != current, axis=2)
+    grid_height = -(-height // tile_size)
+    grid_width = -(-width // tile_size)
+    padded = np.zeros((grid_height * tile_size, grid_width * tile_size), dtype=bool)
+    padded[:height, :width] = changed
+    dirty = padded.reshape(grid_height, tile_size, grid_width, tile_size).any(axis=(1, 3))
+
+    regions = []
+    seen = np.zeros_like(dirty)
+    for row, column in zip(*np.nonzero(dirty)):
+        if seen[row, column]:
+            continue
+        # Flood fill the group of dirty tiles connected to this one
+        seen[row, column] = True
+        stack = [(row, column)]
+        top, left, bottom, right = row, column, row, column
+        while stack:
+            r, c = stack.pop()
+            top, left = min(top, r), min(left, c)
+            bottom, right = max(bottom, r), max(right, c)
+            for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                if 0 <= nr < grid_height and 0 <= nc < grid_width:
+                    if dirty[nr, nc] and not seen[nr, nc]:
+                        seen[nr, nc] = True
+                        stack.append((nr, nc))
+        regions.append(
+            (
+                max(0, left * tile_size - margin),
+                max(0, top * tile_size - margin),
+                min(width, (right + 1) * tile_size + margin),
+                min(height, (bottom + 1) * tile_size + margin),
+            )
+        )
+    return merge_rectangles(regions)
+
+
+def merge_rectangles(rectangles):
+    """
+    Merges overlapping rectangles until none of them overlap.
+    """
+    rectangles = list(rectangles)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rectangles)):
+            for j in range(i + 1, len(rectangles)):
+                if rectangles_intersect(rectangles[i], rectangles[j]):
+                    rectangles[i] = union_rectangles(rectangles[i], rectangles[j])
+                    del rectangles[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rectangles
+
+
+def rectangles_intersect(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def union_rectangles(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def get_box_bounds(box):
+    """
+    Converts an EasyOCR box (four corner points) into (x1, y1, x2, y2).
+    """
+    xs = [point[0] for point in box]
+    ys = [point[1] for point in box]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def normalize_text(text):
+    """
+    Lowercases text, folds unicode look-alikes and turns punctuation into single spaces.
+    """
+    text = unicodedata.normalize("NFKC", str(text)).casefold()
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def get_trigrams(text):
+    padded = f" {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TextIndex:
+    """
+    Index over the OCR results of one frame for ranked text lookups.
+
+    Results are normalized once and indexed by token and character trigram, so a
+    lookup only scores the elements sharing something with the query. Scores combine
+    text similarity (exact, containment, token overlap and fuzzy ratio) with the OCR
+    confidence; equal scores are broken by reading order (top to bottom, left to right).
+    """
+
+    # Candidates scoring lower than this are not considered a match
+    MIN_SCORE = 0.6
+    # At most this many candidates are scored, picked by shared trigrams
+    MAX_CANDIDATES = 32
+    # Queries shorter than this only match whole tokens: "ok" must not match "book"
+    MIN_PARTIAL_LENGTH = 4
+
+    def __init__(self, result):
+        self.texts = []
+        self.tokens = []
+        self.confidences = []
+        self.positions = []
+        self._by_token = collections.defaultdict(set)
+        self._by_trigram = collections.defaultdict(set)
+
+        for index, (box, text, confidence) in enumerate(result):
+            normalized = normalize_text(text)
+            tokens = set(normalized.split())
+            x1, y1, _, _ = get_box_bounds(box)
+            self.texts.append(normalized)
+            self.tokens.append(tokens)
+            self.confidences.append(float(confidence))
+            self.positions.append((y1, x1))
+            for token in tokens:
+                self._by_token[token].add(index)
+            for trigram in get_trigrams(normalized):
+                self._by_trigram[trigram].add(index)
+
+    def _candidates(self, query, query_tokens):
+        shared = collections.Counter()
+        for trigram in get_trigrams(query):
+            shared.update(self._by_trigram.get(trigram, ()))
+        # Whole-token matches count as much as all of the token's trigrams
+        for token in query_tokens:
+            for index in self._by_token.get(token, ()):
+                shared[index] += len(token)
+        return [index for index, _ in shared.most_common(self.MAX_CANDIDATES)]
+
+    def _similarity(self, query, query_tokens, index):
+        text = self.texts[index]
+        if not text:
+            return 0.0
+        if text == query:
+            return 1.0
+        scores = []
+        partial = len(query) >= self.MIN_PARTIAL_LENGTH
+        # Normalized text is separated by single spaces, so this matches whole tokens
+        if f" {query} " in f" {text} ":
+            # "Save" in "Save as" is a better match than "Save" in "Saved drafts folder"
+            scores.append(0.75 + 0.2 * len(query) / len(text))
+        elif partial and query in text:
+            # Inside a word, e.g. "Save" in "Saved", is only a weak match
+            scores.append(0.6 + 0.15 * len(query) / len(text))
+        if query_tokens and self.tokens[index]:
+            overlap = query_tokens & self.tokens[index]
+            scores.append(0.9 * len(overlap) / len(query_tokens | self.tokens[index]))
+        if partial:
+            matcher = difflib.SequenceMatcher(None, query, text, autojunk=False)
+            if matcher.real_quick_ratio() >= self.MIN_SCORE:
+                scores.append(0.95 * matcher.ratio())
+        return max(scores, default=0.0)
+
+    def search(self, search_text, limit=5):
+        """
+        Ranks the indexed elements against `search_text`.
+        Args:
+            search_text (str): The text to look for.
+            limit (int): Maximum number of candidates to return.
+
+        Returns:
+            list: (index, score) tuples, best first, only those above `MIN_SCORE`.
+        """
+        query = normalize_text(search_text)
+        if not query:
+            return []
+        query_tokens = set(query.split())
+
+        ranked = []
+        for index in self._candidates(query, query_tokens):
+            similarity = self._similarity(query, query_tokens, index)
+            score = similarity * (0.85 + 0.15 * self.confidences[index])
+            if score >= self.MIN_SCORE:
+                ranked.append((-score, self.positions[index], index))
+        ranked.sort()
+        return [(index, -score) for score, _, index in ranked[:limit]]
+
+
+# Text indexes of the most recent OCR results, keyed by `id(result)`. The result is
+# stored alongside so its id can't be reused while the entry exists.
+_text_indexes = collections.OrderedDict()
+_text_indexes_lock = threading.Lock()
+
+
+def get_text_index(result):
+    """
+    Returns the `TextIndex` for a list of OCR results, building it on first use.
+    """
+    key = id(result)
+    with _text_indexes_lock:
+        entry = _text_indexes.get(key)
+        if entry is not None and entry[0] is result:
+            _text_indexes.move_to_end(key)
+            return entry[1]
+    index = TextIndex(result)
+    with _text_indexes_lock:
+        _text_indexes[key] = (result, index)
+        while len(_text_indexes) > config.ocr_cache_size:
+            _text_indexes.popitem(last=False)
+    return index
+
+
+def find_text_elements(result, search_text, limit=5):
+    """
+    Searches the OCR results for a text element.
     Args:
         result (list): The list of results returned by EasyOCR.
         search_text (str): The text to search for in the OCR results.
-        image_path (str): Path to the original image.
+        limit (int): Maximum number of candidates to return.
 
     Returns:
-        int: The index of the element containing the search text.
+        list: (index, score) tuples for the best candidates, best first.
+    """
+    return get_text_index(result).search(search_text, limit)
+
+
+def get_text_element(result, search_text, frame):
+    """
+    Searches for a text element in the OCR results and returns the index of the best match. Also draws bounding boxes on the image.
+    Args:
+        result (list): The list of results returned by EasyOCR.
+        search_text (str): The text to search for in the OCR results.
+        frame (Frame): The frame the OCR results were read from.
+
+    Returns:
+        int: The index of the element best matching the search text.
 
     Raises:
         Exception: If the text element is not found in the results.
@@ -24,52 +519,54 @@ def get_text_element(result, search_text, image_path):
     if config.verbose:
         print("[get_text_element]")
         print("[get_text_element] search_text", search_text)
-        # Create /ocr directory if it doesn't exist
-        ocr_dir = "ocr"
-        if not os.path.exists(ocr_dir):
-            os.makedirs(ocr_dir)
 
-        # Open the original image
-        image = Image.open(image_path)
-        draw = ImageDraw.Draw(image)
+    candidates = find_text_elements(result, search_text)
 
-    found_index = None
-    for index, element in enumerate(result):
-        text = element[1]
-        box = element[0]
+    if config.verbose:
+        for index, score in candidates:
+            print(
+                "[get_text_element] candidate",
+                index,
+                repr(result[index][1]),
+                round(score, 3),
+            )
 
-        if config.verbose:
+    artifact_writer = get_artifact_writer()
+    debug = artifact_writer.enabled("debug")
+    if debug:
+        # Draw on a copy so the frame itself stays untouched
+        image = frame.image.copy()
+        draw = ImageDraw.Draw(image)
+        for element in result:
             # Draw bounding box in blue
-            draw.polygon([tuple(point) for point in box], outline="blue")
+            draw.polygon([tuple(point) for point in element[0]], outline="blue")
 
-        if search_text in text:
-            found_index = index
-            if config.verbose:
-                print("[get_text_element][loop] found search_text, index:", index)
-
-    if found_index is not None:
-        if config.verbose:
+    if candidates:
+        found_index = candidates[0][0]
+        if debug:
             # Draw bounding box of the found text in red
             box = result[found_index][0]
             draw.polygon([tuple(point) for point in box], outline="red")
-            # Save the image with bounding boxes
+            # Save the image with bounding boxes in the background
             datetime_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-            ocr_image_path = os.path.join(ocr_dir, f"ocr_image_{datetime_str}.png")
-            image.save(ocr_image_path)
-            print("[get_text_element] OCR image saved at:", ocr_image_path)
+            ocr_image_path = artifact_writer.save(
+                "debug", "ocr", f"ocr_image_{datetime_str}", image
+            )
+            if config.verbose:
+                print("[get_text_element] OCR image saved at:", ocr_image_path)
 
         return found_index
 
     raise Exception("The text element was not found in the image")
 
 
-def get_text_coordinates(result, index, image_path):
+def get_text_coordinates(result, index, frame):
     """
     Gets the coordinates of the text element at the specified index as a percentage of screen width and height.
     Args:
         result (list): The list of results returned by EasyOCR.
         index (int): The index of the text element in the results list.
-        image_path (str): Path to the screenshot image.
+        frame (Frame): The frame the OCR results were read from.
 
     Returns:
         dict: A dictionary containing the 'x' and 'y' coordinates as percentages of the screen width and height.
@@ -90,8 +587,7 @@ def get_text_coordinates(result, index, image_path):
     center_y = (min_y + max_y) / 2
 
     # Get image dimensions
-    with Image.open(image_path) as img:
-        width, height = img.size
+    width, height = frame.size
 
     # Convert to percentages
     percent_x = round((center_x / width), 3)
@@ -0,0 +1,169 @@
+import ast
+import json
+import re
+
+from operate.exceptions import MalformedResponseException
+
+# A fenced block, e.g. ```json ... ```, anywhere in the response
+CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+CLOSING = {"[": "]", "{": "}"}
+
+
+def strip_code_fence(text):
+    """
+    Returns the content of the first fenced code block, or the stripped text without one.
+    """
+    match = CODE_FENCE.search(text)
+    return (match.group(1) if match else text).strip()
+
+
+def normalize_operations(value, text=""):
+    """
+    Returns the operation list of a parsed response.
+
+    Accepts a list of operations, a single operation, and objects wrapping the list
+    such as the `{"operations": [...]}` of the structured output schema.
+    """
+    if isinstance(value, dict):
+        if "operation" in value:
+            value = [value]
+        elif isinstance(value.get("operations"), list):
+            value = value["operations"]
+        else:
+            lists = [item for item in value.values() if isinstance(item, list)]
+            if len(lists) != 1:
+                raise MalformedResponseException(text, "No operation list in the response")
+            value = lists[0]
+    if not isinstance(value, list):
+        raise MalformedResponseException(text, "The response is not an operation list")
+    for operation in value:
+        if not isinstance(operation, dict) or "operation" not in operation:
+            raise MalformedResponseException(text, "Operation without a type")
+    return value
+
+
+def rewrite_json(text, repairs):
+    """
+    Rewrites the first JSON value in `text` into valid JSON where the defects are
+    unambiguous, and notes each kind of repair in `repairs`:
+
+    - `surrounding_text`: prose before or after the value is dropped.
+    - `single_quotes`: single-quoted strings become double-quoted.
+    - `trailing_commas`: commas before a closing bracket are dropped.
+    - `missing_brackets`: open brackets are closed.
+
+    Returns:
+        tuple: The rewritten text, or None if it was cut off inside a string, and for
+        a cut off value the text ending after the last complete element of a list,
+        closed again, or None.
+    """
+    start = min(
+        (index for index in (text.find("["), text.find("{")) if index >= 0),
+        default=-1,
+    )
+    if start < 0:
+        raise MalformedResponseException(text, "No JSON in the response")
+    if start > 0:
+        repairs.add("surrounding_text")
+
+    output = []
+    stack = []
+    quote = None
+    escape = False
+    truncated = None
+    index = start
+    while index < len(text):
+        char = text[index]
+        index += 1
+        if quote:
+            if escape:
+                escape = False
+                # \' is not a valid JSON escape
+                output.append("'" if char == "'" else "\\" + char)
+            elif char == "\\":
+                escape = True
+            elif char == quote:
+                quote = None
+                output.append('"')
+            elif char == '"':
+                output.append('\\"')
+            else:
+                output.append(char)
+            continue
+        if char in "\"'":
+            if char == "'":
+                repairs.add("single_quotes")
+            quote = char
+            output.append('"')
+        elif char in CLOSING:
+            stack.append(CLOSING[char])
+            output.append(char)
+        elif char in "]}":
+            # drop a trailing comma before the closing bracket
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ",":
+                output.pop()
+                repairs.add("trailing_commas")
+            if not stack or char != stack[-1]:
+                raise MalformedResponseException(text, f"Unexpected {char!r}")
+            stack.pop()
+            output.append(char)
+            if stack and stack[-1] == "]":
+                # remember where the value could be cut off without losing this element
+                truncated = (len(output), "".join(reversed(stack)))
+            if not stack:
+                if text[index:].strip():
+                    repairs.add("surrounding_text")
+                return "".join(output), None
+        else:
+            output.append(char)
+
+    # The response was cut off
+    repairs.add("missing_brackets")
+    if truncated:
+        length, closing = truncated
+        truncated = "".join(output[:length]) + closing
+    if quote:
+        # Closing the string would act on a partial value, e.g. half the text to write
+        return None, truncated
+    return "".join(output + list(reversed(stack))), truncated
+
+
+def parse_operations(text):
+    """
+    Parses the operation list of a model response without another request.
+
+    Valid JSON is parsed directly. Otherwise the common defects of model output are
+    repaired locally: fences and surrounding prose, single quotes, trailing commas,
+    Python literals and missing brackets. Of a response that was cut off, only the
+    complete operations are kept.
+
+    Returns:
+        tuple: The list of operations and the set of repairs that were needed.
+    Raises:
+        MalformedResponseException: If no operation list can be recovered.
+    """
+    if not text:
+        raise MalformedResponseException(text or "", "Empty model response")
+    text = strip_code_fence(text)
+    repairs = set()
+    try:
+        return normalize_operations(json.loads(text), text), repairs
+    except ValueError:
+        pass
+
+    rewritten, truncated = rewrite_json(text, repairs)
+    for candidate in filter(None, (truncated, rewritten)):
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            try:
+                # e.g. True/None written by models that think in Python
+                value = ast.literal_eval(candidate)
+                repairs.add("python_literals")
+            except (ValueError, SyntaxError):
+                continue
+        return normalize_operations(value, text), repairs
+    raise MalformedResponseException(text, "Invalid operation list")
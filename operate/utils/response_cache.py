@@ -0,0 +1,223 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+
+import httpx
+
+from operate.config import Config
+from operate.exceptions import ResponseCacheMissException
+from operate.utils.metrics import metrics
+from operate.utils.style import ANSI_GREEN, ANSI_RED, ANSI_RESET
+
+# Load configuration
+config = Config()
+
+
+def hash_data(data):
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def normalize_request_body(value, key=None):
+    """
+    Returns a copy of a JSON request body in which images are replaced by their content
+    hash and text is stripped, so equal requests give equal keys regardless of where
+    the base64 data sits in the provider's message format.
+    """
+    if isinstance(value, dict):
+        if value.get("type") == "base64" and "data" in value:
+            # Anthropic image source
+            return {**value, "data": "image:" + hash_data(value["data"])}
+        return {name: normalize_request_body(item, name) for name, item in value.items()}
+    if isinstance(value, list):
+        if key == "images":
+            # Ollama images
+            return ["image:" + hash_data(str(item)) for item in value]
+        return [normalize_request_body(item) for item in value]
+    if isinstance(value, str):
+        if value.startswith("data:image"):
+            return "image:" + hash_data(value.split("base64,", 1)[-1])
+        return value.strip()
+    return value
+
+
+def get_request_key(request, body):
+    """
+    Content address of a provider request: host, path and the normalized body.
+    Headers (and with them the API keys) are not part of the key.
+    """
+    key = {
+        "method": request.method,
+        "host": request.url.host,
+        "path": request.url.path,
+        "body": normalize_request_body(body),
+    }
+    return hash_data(json.dumps(key, sort_keys=True))
+
+
+class ResponseCache:
+    """
+    Disk-backed store of provider responses, one JSON file per request key.
+
+    Reading an entry refreshes its modification time, and once the directory grows
+    past `max_size` bytes the least recently used entries are deleted.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return entry
+
+    def put(self, key, entry):
+        path = self._path(key)
+        with open(path + ".tmp", "w") as file:
+            json.dump(entry, file)
+        os.replace(path + ".tmp", path)
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_size:
+                    break
+                os.remove(os.path.join(self.directory, name))
+                total -= size
+                metrics.increment("response_cache.evicted")
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """
+    Passes a response body through unchanged and stores it once it was fully read,
+    so streamed responses still reach the caller chunk by chunk while recording.
+    """
+
+    def __init__(self, stream, on_complete):
+        self._stream = stream
+        self._on_complete = on_complete
+
+    async def __aiter__(self):
+        chunks = []
+        async for chunk in self._stream:
+            chunks.append(chunk)
+            yield chunk
+        self._on_complete(b"".join(chunks))
+
+    async def aclose(self):
+        await self._stream.aclose()
+
+
+class ResponseCacheTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that records and replays provider responses.
+
+    Modes:
+        record: Serves responses that are already cached and stores every other
+            successful response.
+        replay: Serves responses from the cache only and fails on a miss, for
+            deterministic runs without network access.
+    """
+
+    def __init__(self, transport, cache, mode):
+        self._transport = transport
+        self._cache = cache
+        self._mode = mode
+
+    async def handle_async_request(self, request):
+        body = None
+        if request.method == "POST":
+            try:
+                body = json.loads(await request.aread())
+            except ValueError:
+                pass
+        if body is None:
+            if self._mode == "replay":
+                return httpx.Response(204, request=request)
+            return await self._transport.handle_async_request(request)
+
+        key = get_request_key(request, body)
+        entry = self._cache.get(key)
+        if entry is not None:
+            metrics.increment("response_cache.hit")
+            return httpx.Response(
+                entry["status"],
+                headers=entry["headers"],
+                content=base64.b64decode(entry["body"]),
+                request=request,
+                extensions={"from_cache": True},
+            )
+        metrics.increment("response_cache.miss")
+        if self._mode == "replay":
+            print(
+                f"{ANSI_GREEN}[Self-Operating Computer]{ANSI_RED}[Error] No recorded response for this {body.get('model')} request {ANSI_RESET}"
+            )
+            raise ResponseCacheMissException(key)
+
+        response = await self._transport.handle_async_request(request)
+        if response.status_code != 200:
+            return response
+
+        def store(content):
+            self._cache.put(
+                key,
+                {
+                    "host": request.url.host,
+                    "model": body.get("model"),
+                    "status": response.status_code,
+                    "headers": [
+                        [name, value]
+                        for name, value in response.headers.items()
+                        if name.lower() not in ("transfer-encoding", "connection")
+                    ],
+                    "body": base64.b64encode(content).decode("utf-8"),
+                },
+            )
+            metrics.increment("response_cache.stored")
+
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, store),
+            extensions=response.extensions,
+            request=request,
+        )
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+def get_transport(limits):
+    """
+    Returns the transport for provider clients: the default pooled transport, wrapped
+    in a `ResponseCacheTransport` unless `config.response_cache` is `off`.
+    """
+    transport = httpx.AsyncHTTPTransport(limits=limits)
+    if config.response_cache == "off":
+        return transport
+    if config.response_cache not in ("record", "replay"):
+        raise ValueError(f"Unknown response cache mode: {config.response_cache}")
+    cache = ResponseCache(
+        config.response_cache_dir, config.response_cache_max_mb * 1024 * 1024
+    )
+    return ResponseCacheTransport(transport, cache, config.response_cache)
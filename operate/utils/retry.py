@@ -0,0 +1,215 @@
+import asyncio
+import json
+import random
+import time
+
+from operate.config import Config
+from operate.exceptions import (
+    CircuitOpenException,
+    MalformedResponseException,
+    ModelNotRecognizedException,
+    ResponseCacheMissException,
+)
+from operate.utils.metrics import metrics
+
+# Load configuration
+config = Config()
+
+# How often each class of error is retried on the same model, and the first backoff delay
+RETRY_POLICIES = {
+    "rate_limit": {"retries": 3, "base_delay": 2.0},
+    "timeout": {"retries": 2, "base_delay": 1.0},
+    "server": {"retries": 2, "base_delay": 1.0},
+    "parse": {"retries": 1, "base_delay": 0.0},
+    "other": {"retries": 0, "base_delay": 0.0},
+    "fatal": {"retries": 0, "base_delay": 0.0},
+}
+
+# Error classes that say something about the provider's health
+PROVIDER_ERRORS = ("rate_limit", "timeout", "server")
+
+# Bugs rather than bad responses: retrying or switching models would only hide them
+PROGRAMMING_ERRORS = (
+    AttributeError,
+    AssertionError,
+    ImportError,
+    IndexError,
+    KeyError,
+    NameError,
+    NotImplementedError,
+    TypeError,
+)
+
+
+def classify_error(error):
+    """
+    Sorts an exception from a provider call into `rate_limit`, `timeout`, `server`,
+    `parse`, `fatal` or `other`.
+
+    Provider SDK errors are recognized by their class name and HTTP status, so none of
+    the SDKs has to be imported here. Wrapped exceptions are followed to their cause.
+    Programming errors such as a `TypeError` are `fatal`, so they surface instead of
+    being retried or sent to the fallback model.
+    """
+    cause = error
+    while cause is not None:
+        if isinstance(cause, (ResponseCacheMissException, ModelNotRecognizedException)):
+            return "fatal"
+        if isinstance(cause, CircuitOpenException):
+            return "other"
+        cause = cause.__cause__
+
+    name = type(error).__name__
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if name == "RateLimitError" or status == 429:
+        return "rate_limit"
+    if "Timeout" in name or isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if status in (401, 403):
+        return "fatal"
+    if name in ("APIConnectionError", "ConnectError", "InternalServerError") or (
+        status is not None and status >= 500
+    ):
+        return "server"
+    if isinstance(error, (MalformedResponseException, json.JSONDecodeError)):
+        return "parse"
+    if isinstance(error, PROGRAMMING_ERRORS):
+        return "fatal"
+    return "other"
+
+
+def get_retry_after(error):
+    """
+    Returns the delay in seconds a rate limited response asked for, if any.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    Stops calling a provider after repeated failures.
+
+    After `failure_threshold` consecutive rate limit, timeout or server errors the
+    circuit opens and calls fail immediately. Once `reset_timeout` seconds passed, one
+    trial call is let through (half open); its outcome closes or re-opens the circuit.
+    The state is published as the `circuit.<provider>` gauge.
+    """
+
+    def __init__(self, provider, failure_threshold, reset_timeout):
+        self.provider = provider
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._set_state("closed")
+
+    def _set_state(self, state):
+        self.state = state
+        metrics.set_gauge(f"circuit.{self.provider}", state)
+
+    def allow(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._set_state("half_open")
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != "closed":
+            self._set_state("closed")
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                metrics.increment(f"circuit.{self.provider}.opened")
+            self.opened_at = time.monotonic()
+            self._set_state("open")
+
+
+_circuit_breakers = {}
+
+
+def get_circuit_breaker(provider):
+    if provider not in _circuit_breakers:
+        _circuit_breakers[provider] = CircuitBreaker(
+            provider, config.circuit_failure_threshold, config.circuit_reset_timeout
+        )
+    return _circuit_breakers[provider]
+
+
+class RetryBudget:
+    """
+    Number of provider attempts a single step may spend, across retries and fallbacks.
+    """
+
+    def __init__(self, attempts):
+        self.remaining = attempts
+
+    def spend(self):
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+async def call_with_retries(provider, request, budget, messages):
+    """
+    Calls `request()` until it succeeds, retrying according to the class of each error.
+
+    Retries wait with exponential backoff and full jitter (or the provider's
+    `Retry-After`), stop when the error's retry limit or the step's budget is used up,
+    and are skipped entirely while the provider's circuit is open. Messages appended by
+    a failed attempt are removed again so a retry doesn't send them twice.
+
+    :param provider: Provider name used for the circuit breaker and metrics.
+    :param request: Coroutine function making one attempt.
+    :param budget: The step's `RetryBudget`.
+    :param messages: The message history the attempt appends to.
+    :return: The result of the first successful attempt.
+    :raises: The last error once no retry is left.
+    """
+    breaker = get_circuit_breaker(provider)
+    retries = {}
+    message_count, system_message = len(messages), messages[0]
+    while True:
+        if not breaker.allow():
+            metrics.increment(f"retry.{provider}.circuit_open")
+            raise CircuitOpenException(provider)
+        if not budget.spend():
+            raise RuntimeError("The retry budget of this step is used up")
+        try:
+            result = await request()
+        except Exception as e:
+            del messages[message_count:]
+            messages[0] = system_message
+
+            kind = classify_error(e)
+            metrics.increment(f"retry.{provider}.{kind}")
+            if kind in PROVIDER_ERRORS:
+                breaker.record_failure()
+            policy = RETRY_POLICIES[kind]
+            retries[kind] = retries.get(kind, 0) + 1
+            if retries[kind] > policy["retries"] or budget.remaining <= 0:
+                raise
+            # Full jitter, so clients that failed together don't retry together
+            backoff = policy["base_delay"] * 2 ** (retries[kind] - 1)
+            delay = random.uniform(0, min(config.retry_max_delay, backoff))
+            if kind == "rate_limit":
+                delay = get_retry_after(e) or delay
+            if config.verbose:
+                print(
+                    f"[call_with_retries] {provider} {kind} error, retrying in {delay:.2f}s:",
+                    e,
+                )
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
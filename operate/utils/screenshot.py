@@ -1,30 +1,176 @@
 import os
 import platform
 import subprocess
+import tempfile
+import threading
 import pyautogui
 from PIL import Image, ImageDraw, ImageGrab
 import Xlib.display
 import Xlib.X
 import Xlib.Xutil  # not sure if Xutil is necessary
 
+from operate.config import Config
+from operate.utils.artifacts import get_artifact_writer
+from operate.utils.frame import Frame
+
+# Load configuration
+config = Config()
+
+
+class DefaultCaptureBackend:
+    """
+    Captures the screen with the platform tools: `pyautogui` on Windows,
+    `ImageGrab` on Linux and `screencapture` on macOS.
+    """
+
+    name = "default"
+
+    def __init__(self):
+        self._display = None
+
+    def grab(self):
+        user_platform = platform.system()
+
+        if user_platform == "Windows":
+            screenshot = pyautogui.screenshot()
+        elif user_platform == "Linux":
+            # Use xlib to prevent scrot dependency for Linux
+            if self._display is None:
+                self._display = Xlib.display.Display()
+            screen = self._display.screen()
+            size = screen.width_in_pixels, screen.height_in_pixels
+            screenshot = ImageGrab.grab(bbox=(0, 0, size[0], size[1]))
+        elif user_platform == "Darwin":  # (Mac OS)
+            # `screencapture` can only write to a file, so read it back from a temporary one
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                file_path = os.path.join(tmp_dir, "screenshot.png")
+                # Use the screencapture utility to capture the screen with the cursor
+                subprocess.run(["screencapture", "-C", "-x", file_path])
+                screenshot = Image.open(file_path)
+                screenshot.load()
+        else:
+            print(
+                f"The platform you're using ({user_platform}) is not currently supported"
+            )
+            return None
+
+        return Frame(screenshot)
+
+    def close(self):
+        if self._display is not None:
+            self._display.close()
+            self._display = None
+
+
+class MssCaptureBackend:
+    """
+    Long-lived `mss` capture backend.
+
+    The `mss` instance, and with it the X connection on Linux, is kept open
+    between steps instead of being re-created for every screenshot. `mss`
+    handles are not safe to share between threads, so one is kept per thread.
+
+    The captured area matches what `pyautogui.size()` reports, so percentage
+    clicks land where the model saw them: the whole X screen on Linux
+    (`monitors[0]`, all monitors) and the primary monitor elsewhere (`monitors[1]`).
+    """
+
+    name = "mss"
+
+    def __init__(self, monitor=None):
+        import mss
+
+        self._mss = mss
+        if monitor is None:
+            monitor = 0 if platform.system() == "Linux" else 1
+        self._monitor = monitor
+        self._local = threading.local()
+        self._instances = []
+        self._lock = threading.Lock()
+
+    def _get_sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            # The cursor is only composited on Linux, but the argument is accepted everywhere
+            sct = self._mss.mss(with_cursor=True)
+            self._local.sct = sct
+            with self._lock:
+                self._instances.append(sct)
+        return sct
+
+    def grab_raw(self):
+        """
+        Captures the configured monitor.
+
+        :return: A tuple of the raw BGRA buffer and the (width, height) of the capture.
+        """
+        sct = self._get_sct()
+        shot = sct.grab(sct.monitors[self._monitor])
+        return shot.raw, shot.size
+
+    def grab(self):
+        raw, size = self.grab_raw()
+        return Frame.from_bgra(raw, size)
+
+    def close(self):
+        with self._lock:
+            for sct in self._instances:
+                sct.close()
+            self._instances = []
+        self._local = threading.local()
+
+
+_capture_backend = None
+
+
+def get_capture_backend():
+    """
+    Returns the process-wide capture backend selected by `config.capture_backend`.
+
+    `auto` uses `mss` where it is installed, except on macOS where `screencapture`
+    is kept because it includes the cursor.
+    """
+    global _capture_backend
+    if _capture_backend is None:
+        backend = config.capture_backend
+        if backend == "auto":
+            backend = "default" if platform.system() == "Darwin" else "mss"
+        if backend == "mss":
+            try:
+                _capture_backend = MssCaptureBackend()
+            except ImportError:
+                if config.verbose:
+                    print("[get_capture_backend] mss is not installed, using default")
+                _capture_backend = DefaultCaptureBackend()
+        elif backend == "default":
+            _capture_backend = DefaultCaptureBackend()
+        else:
+            raise ValueError(f"Unknown capture backend: {backend}")
+        if config.verbose:
+            print("[get_capture_backend] backend", _capture_backend.name)
+    return _capture_backend
+
+
+def capture_frame():
+    """
+    Captures the screen into an in-memory `Frame`.
+
+    Depending on `config.artifact_level` the frame is also written to
+    `screenshots/screenshot.<format>` in the background.
+    """
+    frame = get_capture_backend().grab()
+    if frame is None:
+        return None
+
+    get_artifact_writer().save("final", "screenshots", "screenshot", frame)
+
+    return frame
+
 
 def capture_screen_with_cursor(file_path):
-    user_platform = platform.system()
-
-    if user_platform == "Windows":
-        screenshot = pyautogui.screenshot()
-        screenshot.save(file_path)
-    elif user_platform == "Linux":
-        # Use xlib to prevent scrot dependency for Linux
-        screen = Xlib.display.Display().screen()
-        size = screen.width_in_pixels, screen.height_in_pixels
-        screenshot = ImageGrab.grab(bbox=(0, 0, size[0], size[1]))
-        screenshot.save(file_path)
-    elif user_platform == "Darwin":  # (Mac OS)
-        # Use the screencapture utility to capture the screen with the cursor
-        subprocess.run(["screencapture", "-C", file_path])
-    else:
-        print(f"The platform you're using ({user_platform}) is not currently supported")
+    frame = capture_frame()
+    if frame:
+        frame.save(file_path)
 
 
 def compress_screenshot(raw_screenshot_filename, screenshot_filename):
@@ -0,0 +1,132 @@
+import platform
+import select
+import time
+
+from operate.config import Config
+from operate.utils.screenshot import get_capture_backend
+
+# Load configuration
+config = Config()
+
+
+class DamageSettleWatcher:
+    """
+    Watches the X root window with the DAMAGE extension.
+
+    The X server reports every repaint, so the screen counts as settled once
+    no damage arrived for the quiet period. The connection is kept open
+    between steps.
+    """
+
+    def __init__(self):
+        import Xlib.display
+        from Xlib.ext import damage
+
+        self._display = Xlib.display.Display()
+        if not self._display.has_extension("DAMAGE"):
+            self._display.close()
+            raise RuntimeError("The X server does not support the DAMAGE extension")
+        self._display.damage_query_version()
+        root = self._display.screen().root
+        self._handle = root.damage_create(damage.DamageReportNonEmpty)
+        self._event_type = self._display.extension_event.DamageNotify
+        self._display.sync()
+
+    def _drain(self):
+        damaged = False
+        while self._display.pending_events():
+            event = self._display.next_event()
+            if event.type == self._event_type:
+                damaged = True
+        if damaged:
+            # Re-arm the `NonEmpty` report so the next repaint sends a new event
+            self._display.damage_subtract(self._handle)
+            self._display.flush()
+        return damaged
+
+    def wait(self, quiet, timeout):
+        deadline = time.monotonic() + timeout
+        self._drain()
+        self._display.damage_subtract(self._handle)
+        self._display.sync()
+        quiet_since = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now - quiet_since >= quiet:
+                return True
+            if now >= deadline:
+                return False
+            wait_for = min(quiet - (now - quiet_since), deadline - now)
+            select.select([self._display.fileno()], [], [], wait_for)
+            if self._drain():
+                quiet_since = time.monotonic()
+
+
+class PollSettleWatcher:
+    """
+    Fallback that captures frames and compares their block sums until the
+    screen stayed the same for the quiet period.
+    """
+
+    def __init__(self, interval=0.05):
+        self._interval = interval
+
+    def wait(self, quiet, timeout):
+        backend = get_capture_backend()
+        deadline = time.monotonic() + timeout
+        previous = backend.grab()
+        if previous is None:
+            time.sleep(timeout)
+            return False
+        quiet_since = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now - quiet_since >= quiet:
+                return True
+            if now >= deadline:
+                return False
+            time.sleep(min(self._interval, deadline - now))
+            current = backend.grab()
+            if (current.block_sums != previous.block_sums).any():
+                quiet_since = time.monotonic()
+            previous = current
+
+
+_settle_watcher = None
+
+
+def get_settle_watcher():
+    global _settle_watcher
+    if _settle_watcher is None:
+        if platform.system() == "Linux":
+            try:
+                _settle_watcher = DamageSettleWatcher()
+            except Exception as e:
+                if config.verbose:
+                    print(
+                        "[get_settle_watcher] X DAMAGE unavailable, polling instead:",
+                        e,
+                    )
+        if _settle_watcher is None:
+            _settle_watcher = PollSettleWatcher()
+    return _settle_watcher
+
+
+def wait_for_screen_settle():
+    """
+    Blocks until the screen stopped changing for `config.settle_quiet` seconds,
+    or at most `config.settle_timeout` seconds.
+
+    Returns:
+        bool: True if the screen settled, False if the timeout was reached.
+    """
+    start = time.monotonic()
+    settled = get_settle_watcher().wait(config.settle_quiet, config.settle_timeout)
+    if config.verbose:
+        print(
+            "[wait_for_screen_settle] settled",
+            settled,
+            "after",
+            f"{time.monotonic() - start:.3f}s",
+        )
+    return settled
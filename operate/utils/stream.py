@@ -0,0 +1,150 @@
+import json
+
+from operate.exceptions import MalformedResponseException
+
+# Start of a structured output response, without whitespace
+WRAPPER_START = '{"operations":['
+
+
+class OperationStreamParser:
+    """
+    Incrementally parses a JSON array of operations as the model streams it.
+
+    Text is fed in arbitrary chunks; every operation object is returned as soon
+    as its closing brace arrives, so it can be executed while the rest of the
+    response is still being generated. Text before the array (e.g. a ```json
+    fence or the `{"operations":` of structured output) and after it is ignored. Anything else that can't be part of the
+    array raises `MalformedResponseException`, so the caller can stop before
+    acting on a broken tail.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._state = "before"  # before, between, object, done
+        self._single = False  # the model sent one object instead of an array
+        self._expect_comma = False
+        self._object_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._error = None
+        self.count = 0
+
+    @property
+    def done(self):
+        return self._state == "done"
+
+    def feed(self, chunk):
+        """
+        Adds streamed text and returns the operations completed by it.
+
+        :param chunk: The next piece of the response text.
+        :return: A list of operation dicts, possibly empty.
+        """
+        if self._error:
+            raise self._error
+        self.text += chunk
+        operations = []
+        try:
+            self._scan(operations)
+        except MalformedResponseException as e:
+            if not operations:
+                raise
+            # Hand out what completed before the error, and raise on the next call
+            self._error = e
+        return operations
+
+    def _scan(self, operations):
+        text = self.text
+        while self._position < len(text) and self._state != "done":
+            char = text[self._position]
+            if self._state == "before":
+                if char == "[":
+                    self._state = "between"
+                elif char == "{":
+                    offset = self._match_wrapper(text[self._position :])
+                    if offset is None:
+                        return  # wait until the next chunk tells
+                    if offset:
+                        self._position += offset
+                        self._state = "between"
+                    else:
+                        self._single = True
+                        self._start_object()
+            elif self._state == "between":
+                if char == "{" and not self._expect_comma:
+                    self._start_object()
+                elif char == "," and self._expect_comma:
+                    self._expect_comma = False
+                elif char == "]" and (self._expect_comma or not self.count):
+                    self._state = "done"
+                elif not char.isspace():
+                    raise MalformedResponseException(
+                        text, f"Unexpected {char!r} in the operation list"
+                    )
+            else:
+                operation = self._scan_object(char)
+                if operation is not None:
+                    operations.append(operation)
+            self._position += 1
+
+    def _match_wrapper(self, text):
+        """
+        Returns the offset of the list in a `{"operations": [` wrapper starting `text`,
+        False if `text` starts a single operation instead, or None if it's too short to tell.
+        """
+        compact = "".join(text.split())
+        if len(compact) < len(WRAPPER_START):
+            return None if WRAPPER_START.startswith(compact) else False
+        if compact.startswith(WRAPPER_START):
+            return text.index("[")
+        return False
+
+    def close(self):
+        """
+        Checks that the whole operation list was received once the stream ended.
+        """
+        if self._error:
+            raise self._error
+        if self._state != "done":
+            raise MalformedResponseException(
+                self.text, "The response ended before the operation list was complete"
+            )
+
+    def _start_object(self):
+        self._state = "object"
+        self._object_start = self._position
+        self._depth = 1
+
+    def _scan_object(self, char):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == "\\":
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+            return None
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            self._depth += 1
+        elif char in "}]":
+            self._depth -= 1
+            if self._depth == 0:
+                return self._finish_object()
+        return None
+
+    def _finish_object(self):
+        raw = self.text[self._object_start : self._position + 1]
+        try:
+            operation = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise MalformedResponseException(self.text, f"Invalid operation: {e}")
+        if not isinstance(operation, dict) or "operation" not in operation:
+            raise MalformedResponseException(self.text, "Operation without a type")
+        self.count += 1
+        self._expect_comma = True
+        self._state = "done" if self._single else "between"
+        return operation
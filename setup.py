@@ -16,6 +16,7 @@ setup(
     entry_points={
         "console_scripts": [
             "operate=operate.main:main_entry",
+            "operate-mock-llm=operate.mock_llm:main_entry",
         ],
     },
     package_data={